@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Almacén de embeddings en disco (matriz mapeada en memoria)
+
+Sustituye al pickle de dict md5 -> lista de floats. El almacén de una
+generación son dos .npy que se abren con mmap (no se leen enteros):
+
+    claves-<gen>.npy   huellas md5 (S32) ordenadas, se buscan por bisección
+    matriz-<gen>.npy   fila i = embedding de claves[i] (float32 o float16)
+    uso-<gen>.npy      hora (desde epoch) del último acceso a cada fila
+    diario-<gen>.bin   altas posteriores: registros (clave, vector) añadidos
+
+y `actual.json` apunta a la generación vigente. Guardar solo vacía el
+diario; cuando crece lo bastante se compacta en una generación nueva que
+se escribe aparte y se publica renombrando `actual.json`, así un corte a
+mitad deja siempre una generación válida.
+
+La compactación es también la expulsión: se descartan las filas sin uso
+en `ttl_dias` y, si aun así se supera `max_entradas`, las menos usadas
+recientemente (LRU). Se compacta cuando el diario o las filas expulsables
+crecen lo bastante, o si se pasa del presupuesto.
+
+Se usa como un dict: `clave in almacen`, `almacen[clave]` (vista de la
+fila, sin copiar) y `almacen[clave] = vector`. Con `solo_lectura` las altas
+se quedan en memoria y no se toca el disco (procesos que conviven con el
+que escribe, como servicio_embeddings.py).
+"""
+
+import os
+import json
+import pickle
+import logging
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from config import EMBEDDINGS_DIR, EMBEDDINGS_DTYPE, EMBEDDINGS_MAX_ENTRADAS, EMBEDDINGS_TTL_DIAS
+from persistencia import cargar_json, escribir_atomico
+
+LONG_CLAVE = 32  # md5 en hexadecimal
+COMPACTAR_MIN_FILAS = 2000  # el diario se compacta al superar esto...
+COMPACTAR_FRACCION = 0.25  # ...y esta fracción de la matriz base (igual para las expulsables)
+BLOQUE_COMPACTAR = 8192
+
+
+class AlmacenEmbeddings:
+    def __init__(self, directorio=EMBEDDINGS_DIR, dtype=EMBEDDINGS_DTYPE, migrar_de=None,
+                 max_entradas=EMBEDDINGS_MAX_ENTRADAS, ttl_dias=EMBEDDINGS_TTL_DIAS, solo_lectura=False):
+        self.directorio = directorio
+        self.solo_lectura = solo_lectura
+        self.max_entradas = max_entradas
+        self.ttl_horas = ttl_dias * 24 if ttl_dias else None
+        self.hora = int(time.time() // 3600)
+        # Estadísticas de la ejecución
+        self.aciertos = 0
+        self.expulsadas = 0
+        self._leidas = set()
+        self._insertadas = set()
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta_meta = os.path.join(directorio, "actual.json")
+        self.meta = cargar_json(self.ruta_meta, {"generacion": 0, "dim": None, "dtype": dtype})
+        self.dtype = np.dtype(self.meta["dtype"])
+        self._lock = threading.Lock()
+        self._abrir()
+
+        if migrar_de and not len(self) and os.path.exists(migrar_de):
+            self._migrar(migrar_de)
+
+    # ---------- rutas y apertura ----------
+    def _ruta(self, nombre, generacion=None):
+        generacion = self.meta["generacion"] if generacion is None else generacion
+        extension = "bin" if nombre == "diario" else "npy"
+        return os.path.join(self.directorio, f"{nombre}-{generacion}.{extension}")
+
+    def _abrir(self):
+        if os.path.exists(self._ruta("matriz")):
+            self.claves = np.load(self._ruta("claves"), mmap_mode="r")
+            self.matriz = np.load(self._ruta("matriz"), mmap_mode="r")
+        else:
+            self.claves = np.empty(0, dtype=f"S{LONG_CLAVE}")
+            self.matriz = None
+        if os.path.exists(self._ruta("uso")):
+            self._uso = np.load(self._ruta("uso"))
+        else:
+            self._uso = np.full(len(self.claves), self.hora, dtype=np.int32)
+        self._uso_modificado = False
+        # Altas del diario: clave -> fila en self._extra
+        self._nuevas = {}
+        self._extra = None
+        self._diario = None
+        self._leer_diario()
+
+    def _tipo_registro(self):
+        return np.dtype([("clave", f"S{LONG_CLAVE}"), ("vector", self.dtype, (self.meta["dim"],))])
+
+    def _leer_diario(self):
+        ruta = self._ruta("diario")
+        if not self.meta["dim"] or not os.path.exists(ruta):
+            return
+        tipo = self._tipo_registro()
+        with open(ruta, "rb") as f:
+            datos = f.read()
+        # Un registro a medias (corte durante la escritura) se descarta
+        completos = len(datos) // tipo.itemsize
+        if not completos:
+            return
+        registros = np.frombuffer(datos, dtype=tipo, count=completos)
+        self._extra = registros["vector"].copy()
+        for fila, clave in enumerate(registros["clave"].tolist()):
+            self._nuevas[clave.decode("ascii")] = fila
+        logging.info(f"🗂️ {completos} embeddings recuperados del diario")
+
+    # ---------- interfaz de dict ----------
+    def _fila_base(self, clave):
+        if not len(self.claves):
+            return None
+        objetivo = clave.encode("ascii")
+        i = int(np.searchsorted(self.claves, objetivo))
+        if i < len(self.claves) and self.claves[i] == objetivo:
+            return i
+        return None
+
+    def __len__(self):
+        return len(self.claves) + len(self._nuevas)
+
+    def __contains__(self, clave):
+        return clave in self._nuevas or self._fila_base(clave) is not None
+
+    def __getitem__(self, clave):
+        fila = self._nuevas.get(clave)
+        if fila is not None:
+            self._registrar_lectura(clave)
+            return self._extra[fila]
+        fila = self._fila_base(clave)
+        if fila is None:
+            raise KeyError(clave)
+        self._registrar_lectura(clave)
+        if self._uso[fila] != self.hora:
+            self._uso[fila] = self.hora
+            self._uso_modificado = True
+        return self.matriz[fila]
+
+    def _registrar_lectura(self, clave):
+        if clave not in self._leidas:
+            self._leidas.add(clave)
+            if clave not in self._insertadas:
+                self.aciertos += 1
+
+    def get(self, clave, defecto=None):
+        try:
+            return self[clave]
+        except KeyError:
+            return defecto
+
+    def keys(self):
+        return [c.decode("ascii") for c in self.claves.tolist()] + list(self._nuevas)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __setitem__(self, clave, vector):
+        """Las claves son huellas del texto: una clave existente no se reescribe"""
+        vector = np.asarray(vector, dtype=self.dtype).reshape(-1)
+        with self._lock:
+            if clave in self:
+                return
+            if not self.meta["dim"]:
+                self.meta["dim"] = len(vector)
+                if not self.solo_lectura:
+                    try:
+                        self._publicar_meta()
+                    except Exception as e:
+                        # Sin `dim` en disco el diario no se podría leer al reabrir
+                        logging.warning(f"Error guardando {self.ruta_meta}: {e}; las altas se quedan en memoria")
+                        self.solo_lectura = True
+            if self._extra is None:
+                self._extra = np.empty((64, self.meta["dim"]), dtype=self.dtype)
+            elif len(self._nuevas) == len(self._extra):
+                # Capacidad doble; las vistas ya entregadas siguen apuntando a la anterior
+                self._extra = np.concatenate([self._extra, np.empty_like(self._extra)])
+            fila = len(self._nuevas)
+            self._extra[fila] = vector
+
+            if not self.solo_lectura:
+                if self._diario is None:
+                    self._diario = open(self._ruta("diario"), "ab")
+                registro = np.zeros(1, dtype=self._tipo_registro())
+                registro["clave"] = clave.encode("ascii")
+                registro["vector"] = vector
+                self._diario.write(registro.tobytes())
+            self._nuevas[clave] = fila
+            self._insertadas.add(clave)
+
+    # ---------- persistencia ----------
+    def _conservar(self, uso):
+        """Máscara de filas que sobreviven a la expulsión (TTL y luego LRU)"""
+        conservar = np.ones(len(uso), dtype=bool)
+        if self.ttl_horas:
+            conservar &= uso >= self.hora - self.ttl_horas
+        if self.max_entradas and conservar.sum() > self.max_entradas:
+            # A igual hora gana la fila posterior: el diario va tras la base y en
+            # orden de alta, así lo recién codificado no es lo primero en salir
+            candidatas = np.flatnonzero(conservar)[::-1]
+            recientes = candidatas[np.argsort(-uso[candidatas], kind="stable")[:self.max_entradas]]
+            conservar[:] = False
+            conservar[recientes] = True
+        return conservar
+
+    def guardar(self):
+        """Vuelca el diario y compacta (expulsando) si ha crecido lo bastante"""
+        if self.solo_lectura:
+            return
+        with self._lock:
+            if self._diario is not None:
+                self._diario.flush()
+                os.fsync(self._diario.fileno())
+
+            n_total = len(self)
+            expulsables = n_total - int(self._conservar(self._uso_total()).sum())
+            umbral = max(COMPACTAR_MIN_FILAS, COMPACTAR_FRACCION * len(self.claves))
+            fuera_de_presupuesto = self.max_entradas and n_total > self.max_entradas
+            if len(self._nuevas) > umbral or expulsables > umbral or fuera_de_presupuesto:
+                self._compactar()
+            elif self._uso_modificado:
+                self._guardar_uso(self._uso, self._ruta("uso"))
+                self._uso_modificado = False
+
+            fallos = len(self._insertadas)
+            consultas = self.aciertos + fallos
+            tasa = 100 * self.aciertos / consultas if consultas else 0
+            logging.info(
+                f"🗂️ Caché de embeddings: {self.aciertos} aciertos, {fallos} fallos ({tasa:.0f}% aciertos), "
+                f"{self.expulsadas} expulsados, {len(self)} filas"
+            )
+
+    def compactar(self):
+        with self._lock:
+            self._compactar()
+
+    def _uso_total(self):
+        """Última hora de uso de las filas base seguidas de las del diario"""
+        return np.concatenate([self._uso, np.full(len(self._nuevas), self.hora, dtype=np.int32)])
+
+    def _publicar_meta(self):
+        escribir_atomico(self.ruta_meta, lambda f: json.dump(self.meta, f, ensure_ascii=False), binario=False)
+
+    def _guardar_uso(self, uso, ruta):
+        escribir_atomico(ruta, lambda f: np.save(f, uso))
+
+    def _compactar(self):
+        if not self.meta["dim"] or self.solo_lectura:
+            return
+        anterior = self.meta["generacion"]
+        generacion = anterior + 1
+        n_base = len(self.claves)
+        dim = self.meta["dim"]
+
+        claves_nuevas = np.array([c.encode("ascii") for c in self._nuevas], dtype=f"S{LONG_CLAVE}")
+        filas_nuevas = np.fromiter(self._nuevas.values(), dtype=np.int64, count=len(self._nuevas))
+        todas = np.concatenate([np.asarray(self.claves), claves_nuevas])
+        uso = self._uso_total()
+        conservar = self._conservar(uso)
+        self.expulsadas += int((~conservar).sum())
+        orden = np.flatnonzero(conservar)
+        orden = orden[np.argsort(todas[orden], kind="stable")]
+
+        # La matriz nueva se rellena por bloques sin cargar la vieja entera
+        fd, tmp_matriz = tempfile.mkstemp(dir=self.directorio, prefix=".tmp_", suffix=".npy")
+        os.close(fd)
+        salida = np.lib.format.open_memmap(tmp_matriz, mode="w+", dtype=self.dtype, shape=(len(orden), dim))
+        for inicio in range(0, len(orden), BLOQUE_COMPACTAR):
+            origen = orden[inicio:inicio + BLOQUE_COMPACTAR]
+            de_base = origen < n_base
+            bloque = np.empty((len(origen), dim), dtype=self.dtype)
+            if de_base.any():
+                bloque[de_base] = self.matriz[origen[de_base]]
+            if not de_base.all():
+                bloque[~de_base] = self._extra[filas_nuevas[origen[~de_base] - n_base]]
+            salida[inicio:inicio + len(origen)] = bloque
+        salida.flush()
+        del salida
+
+        fd, tmp_claves = tempfile.mkstemp(dir=self.directorio, prefix=".tmp_", suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, todas[orden])
+        for tmp in (tmp_matriz, tmp_claves):
+            os.chmod(tmp, 0o644)
+        os.replace(tmp_matriz, self._ruta("matriz", generacion))
+        os.replace(tmp_claves, self._ruta("claves", generacion))
+        self._guardar_uso(uso[orden], self._ruta("uso", generacion))
+
+        # Publicar la generación nueva es un único rename atómico; si falla se
+        # sigue con la anterior y la nueva se descarta
+        self.meta["generacion"] = generacion
+        try:
+            self._publicar_meta()
+        except BaseException:
+            self.meta["generacion"] = anterior
+            for nombre in ("matriz", "claves", "uso"):
+                ruta = self._ruta(nombre, generacion)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            raise
+
+        if self._diario is not None:
+            self._diario.close()
+        for nombre in ("matriz", "claves", "uso", "diario"):
+            ruta = self._ruta(nombre, anterior)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        self._abrir()
+        logging.info(f"🗂️ Almacén de embeddings compactado: {len(self)} filas (generación {generacion})")
+
+    def _migrar(self, ruta_pickle):
+        """Importa la caché antigua (pickle de dict md5 -> lista)"""
+        try:
+            with open(ruta_pickle, "rb") as f:
+                antigua = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Error migrando {ruta_pickle}: {e}")
+            return
+        for clave, vector in antigua.items():
+            self[clave] = vector
+        with self._lock:
+            if self._nuevas:
+                self._compactar()
+        self._insertadas.clear()
+        logging.info(f"🗂️ {len(antigua)} embeddings migrados desde {ruta_pickle}")
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Archivo de respuestas de los feeds (grabar / reproducir)
+
+Al grabar, cada cuerpo descargado se guarda comprimido y direccionado por
+su SHA-256 (los cuerpos repetidos entre ejecuciones no ocupan más) y cada
+ejecución deja un manifiesto con, por medio, status, cabeceras y el máximo
+y el cupo de entradas usados. Los feeds que el planificador no consultó
+guardan las entradas reutilizadas y los que no aportaron nada (circuito
+abierto, descarga fallida) quedan como omitidos. Al reproducir,
+recoger_noticias_paralelo lee de ese manifiesto en lugar de la red, así el
+pipeline completo se puede medir y perfilar offline con entradas idénticas.
+
+La reproducción no toca el estado persistido (feeds, salud, vistos,
+historias, planificador) ni escribe en el almacén de embeddings, y deja las
+páginas y noticias_cache.json en reproducciones/<ID_EJECUCION>/.
+
+    python rss_prisma.py --grabar
+    python rss_prisma.py --reproducir [ID_EJECUCION]
+"""
+
+import os
+import gzip
+import hashlib
+import logging
+from datetime import datetime
+
+from config import ARCHIVO_FEEDS_DIR
+from persistencia import cargar_json, guardar_json, escribir_atomico
+
+
+class ArchivoFeeds:
+    def __init__(self, reproducir=None, directorio=ARCHIVO_FEEDS_DIR):
+        """`reproducir` es el id de la ejecución a reproducir ("ultima" para
+        la más reciente); sin él, el archivo graba la ejecución actual."""
+        self.directorio = directorio
+        self.dir_cuerpos = os.path.join(directorio, "cuerpos")
+        self.dir_ejecuciones = os.path.join(directorio, "ejecuciones")
+        os.makedirs(self.dir_cuerpos, exist_ok=True)
+        os.makedirs(self.dir_ejecuciones, exist_ok=True)
+        # Último cuerpo de cada medio, para resolver los 304 al grabar
+        self.ruta_ultimos = os.path.join(directorio, "ultimos.json")
+        self.ultimos = cargar_json(self.ruta_ultimos)
+
+        self.reproduciendo = reproducir is not None
+        if self.reproduciendo:
+            if reproducir == "ultima":
+                reproducir = self.ejecuciones()[-1]
+            self.ejecucion = reproducir
+            self.manifiesto = cargar_json(self._ruta_manifiesto())
+            self.salida = os.path.join(directorio, "reproducciones", self.ejecucion)
+            os.makedirs(self.salida, exist_ok=True)
+            logging.info(f"📼 Reproduciendo ejecución {self.ejecucion} ({len(self.manifiesto)} feeds)")
+        else:
+            self.ejecucion = datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.manifiesto = {}
+
+    def ejecuciones(self):
+        ids = sorted(f[:-5] for f in os.listdir(self.dir_ejecuciones) if f.endswith(".json"))
+        if not ids:
+            raise FileNotFoundError(f"No hay ejecuciones grabadas en {self.dir_ejecuciones}")
+        return ids
+
+    def _ruta_manifiesto(self):
+        return os.path.join(self.dir_ejecuciones, f"{self.ejecucion}.json")
+
+    def _ruta_cuerpo(self, huella):
+        return os.path.join(self.dir_cuerpos, huella[:2], huella + ".gz")
+
+    def necesita_cuerpo(self, medio):
+        """Al grabar, un medio sin cuerpo archivado se pide sin GET condicional"""
+        return not self.reproduciendo and medio not in self.ultimos
+
+    def grabar(self, medio, url, status, cuerpo, cabeceras):
+        if status == 304:
+            # Sin cuerpo: se archiva el último conocido del medio
+            huella = self.ultimos.get(medio)
+        else:
+            huella = hashlib.sha256(cuerpo).hexdigest()
+            ruta = self._ruta_cuerpo(huella)
+            if not os.path.exists(ruta):
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                escribir_atomico(ruta, lambda f: f.write(gzip.compress(cuerpo)))
+            self.ultimos[medio] = huella
+        if huella:
+            # El cuerpo se archiva ya descomprimido
+            cabeceras = {k: v for k, v in cabeceras.items() if k not in ("content-encoding", "content-length")}
+            self.manifiesto.setdefault(medio, {}).update(
+                url=url, status=status, cabeceras=cabeceras, cuerpo=huella)
+
+    def anotar_cupos(self, maximos, cupos):
+        """Al grabar, máximo (tope de parseo) y cupo de cada medio"""
+        for medio, maximo in maximos.items():
+            self.manifiesto.setdefault(medio, {}).update(maximo=maximo, cupo=cupos[medio])
+
+    def reutilizar(self, medio, entradas):
+        """Al grabar, entradas guardadas que usa un feed no consultado"""
+        self.manifiesto.setdefault(medio, {})["entradas"] = entradas
+
+    def anotar_omitidos(self, medios):
+        """Al grabar, marca los medios que no han dejado ni cuerpo ni entradas"""
+        for medio in medios:
+            registro = self.manifiesto.setdefault(medio, {})
+            if "cuerpo" not in registro and "entradas" not in registro:
+                registro["omitido"] = True
+
+    def cupos(self, medios, por_defecto):
+        """(maximos, cupos) grabados; `por_defecto` para los que no los tienen"""
+        registros = {medio: self.manifiesto.get(medio, {}) for medio in medios}
+        return ({medio: r.get("maximo", por_defecto) for medio, r in registros.items()},
+                {medio: r.get("cupo", por_defecto) for medio, r in registros.items()})
+
+    def omitido(self, medio):
+        return self.manifiesto.get(medio, {}).get("omitido", False)
+
+    def reutilizadas(self, medio):
+        """Entradas reutilizadas por el medio en la ejecución grabada, o None"""
+        return self.manifiesto.get(medio, {}).get("entradas")
+
+    def leer(self, medio):
+        """(status, cuerpo, cabeceras) grabados para el medio, o None.
+        Siempre se devuelve como 200 para que el cuerpo se parsee de nuevo."""
+        registro = self.manifiesto.get(medio)
+        if not registro or "cuerpo" not in registro:
+            return None
+        with open(self._ruta_cuerpo(registro["cuerpo"]), "rb") as f:
+            cuerpo = gzip.decompress(f.read())
+        return 200, cuerpo, registro["cabeceras"]
+
+    def guardar(self):
+        if self.reproduciendo:
+            return
+        guardar_json(self._ruta_manifiesto(), self.manifiesto)
+        guardar_json(self.ruta_ultimos, self.ultimos)
+        logging.info(f"📼 Ejecución {self.ejecucion} grabada ({len(self.manifiesto)} feeds)")
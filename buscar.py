@@ -10,43 +10,30 @@ import json
 import urllib.parse
 from datetime import datetime
 import numpy as np
-import os
-import pickle
 import hashlib
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
 # Importar config
 from config import *
+from almacen_embeddings import AlmacenEmbeddings
+from similitud import similitudes, seleccionar
+from modelo_ia import codificar, similitudes_servicio, usar_servicio, directorio_embeddings
 
 # ========== CONFIGURACIÓN ==========
-CACHE_BUSQUEDAS = "busquedas_cache.pkl"
 UMBRAL_RELEVANCIA = 0.5  # Mínimo para considerar una noticia relevante
 MAX_RESULTADOS = 100
 
-# ========== CARGAR MODELO (UNA SOLA VEZ) ==========
-print("🔄 Cargando modelo IA...")
-modelo = SentenceTransformer("all-MiniLM-L6-v2")
-
 # ========== FUNCIONES DE CACHÉ ==========
 def get_cache_key(texto):
     return hashlib.md5(texto.encode('utf-8')).hexdigest()
 
 def cargar_cache():
-    if os.path.exists(CACHE_BUSQUEDAS):
-        try:
-            with open(CACHE_BUSQUEDAS, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
-
-def guardar_cache(cache):
+    # Mismo almacén que rss_prisma.py: los titulares ya codificados son
+    # aciertos. Solo lectura: lo escribe (y compacta) rss_prisma.py y no hay
+    # cerrojo entre procesos; lo que se codifique aquí se queda en memoria
     try:
-        with open(CACHE_BUSQUEDAS, 'wb') as f:
-            pickle.dump(cache, f)
-    except:
-        pass
+        return AlmacenEmbeddings(directorio_embeddings(), solo_lectura=True)
+    except Exception:
+        return {}
 
 # ========== BÚSQUEDA SEMÁNTICA MEJORADA ==========
 def buscar_noticias_semantico(consulta, noticias, embedding_cache, top_n=50):
@@ -54,48 +41,33 @@ def buscar_noticias_semantico(consulta, noticias, embedding_cache, top_n=50):
     if not consulta or not noticias:
         return []
     
-    # Cache para la consulta
-    key_consulta = get_cache_key(consulta)
-    if key_consulta in embedding_cache:
-        emb_consulta = np.array(embedding_cache[key_consulta])
-    else:
-        emb_consulta = modelo.encode([consulta])[0]
-        embedding_cache[key_consulta] = emb_consulta.tolist()
-    
-    # Obtener embeddings de noticias
+    # Con el servicio local (servicio_embeddings.py) todo se resuelve allí
     titulos = [n["titulo"] for n in noticias]
-    embeddings = []
-    indices_validos = []
-    
-    for i, titulo in enumerate(titulos):
-        key = get_cache_key(titulo)
-        if key in embedding_cache:
-            embeddings.append(np.array(embedding_cache[key]))
-            indices_validos.append(i)
-        else:
-            emb = modelo.encode([titulo])[0]
-            embedding_cache[key] = emb.tolist()
-            embeddings.append(emb)
-            indices_validos.append(i)
-    
-    if not embeddings:
-        return []
-    
-    # Calcular similitudes
-    embeddings = np.array(embeddings)
-    similitudes = cosine_similarity([emb_consulta], embeddings)[0]
+    sims = similitudes_servicio(consulta, titulos)
+    if sims is None:
+        # Cache para la consulta
+        key_consulta = get_cache_key(consulta)
+        if key_consulta not in embedding_cache:
+            embedding_cache[key_consulta] = codificar([consulta])[0]
+        emb_consulta = np.asarray(embedding_cache[key_consulta], dtype=np.float32)
+        
+        # Obtener embeddings de noticias (los que falten, en un solo lote)
+        keys = [get_cache_key(t) for t in titulos]
+        faltan = [i for i, key in enumerate(keys) if key not in embedding_cache]
+        if faltan:
+            nuevos = codificar([titulos[i] for i in faltan])
+            for i, emb in zip(faltan, nuevos):
+                embedding_cache[keys[i]] = emb
+        
+        # Calcular similitudes
+        embeddings = np.array([embedding_cache[key] for key in keys], dtype=np.float32)
+        sims = similitudes(emb_consulta, embeddings)
     
     # Filtrar y ordenar
-    resultados = []
-    for idx, sim in zip(indices_validos, similitudes):
-        if sim > UMBRAL_RELEVANCIA:
-            resultados.append({
-                "noticia": noticias[idx],
-                "similitud": round(sim, 3)
-            })
-    
-    resultados.sort(key=lambda x: x["similitud"], reverse=True)
-    return resultados[:top_n]
+    return [
+        {"noticia": noticias[idx], "similitud": round(float(sims[idx]), 3)}
+        for idx in seleccionar(sims, top_n, umbral=UMBRAL_RELEVANCIA)
+    ]
 
 # ========== DESTACAR PALABRAS CLAVE ==========
 def destacar_palabras(titulo, consulta):
@@ -298,6 +270,7 @@ def main():
     
     consulta = sys.argv[1].strip()
     print(f"🔍 Buscando: {consulta}")
+    usar_servicio()
     
     # Cargar caché
     embedding_cache = cargar_cache()
@@ -315,9 +288,6 @@ def main():
     resultados = buscar_noticias_semantico(consulta, noticias, embedding_cache, top_n=MAX_RESULTADOS)
     print(f"✅ {len(resultados)} resultados encontrados")
     
-    # Guardar caché actualizada
-    guardar_cache(embedding_cache)
-    
     # Generar sugerencias
     sugerencias = sugerir_palabras(consulta, [r['noticia'] for r in resultados]) if resultados else []
     
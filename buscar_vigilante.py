@@ -12,8 +12,9 @@ from datetime import datetime
 import numpy as np
 
 from config import *
+from modelo_ia import usar_servicio
 from rss_prisma import (
-    modelo, cargar_cache_embeddings, get_embedding_cache_key,
+    cargar_cache_embeddings, calcular_embeddings,
     buscar_noticias_semantico, clusterizar,
     generar_vigilante_html
 )
@@ -28,9 +29,10 @@ def main():
     consulta_url = urllib.parse.quote(consulta)
     
     print(f"👁️ Buscando: {consulta}")
+    usar_servicio()
     
-    # Cargar caché
-    embedding_cache = cargar_cache_embeddings() if CACHE_EMBEDDINGS else {}
+    # Cargar caché: solo lectura, el almacén lo escribe rss_prisma.py
+    embedding_cache = cargar_cache_embeddings(solo_lectura=True) if CACHE_EMBEDDINGS else {}
     
     # Cargar noticias
     try:
@@ -49,9 +51,10 @@ def main():
     if not noticias_filtradas:
         grupos = []
     else:
-        # Calcular embeddings y clusterizar
-        titulos = [n["titulo"] for n in noticias_filtradas]
-        embeddings = modelo.encode(titulos, batch_size=32, show_progress_bar=False)
+        # Los títulos de noticias_cache.json los dejó en el almacén rss_prisma.py
+        # y salen de ahí; con el servicio activo la búsqueda no escribe en la
+        # caché, así que los que falten se codifican ahora (en el servicio)
+        embeddings = calcular_embeddings(noticias_filtradas, embedding_cache)
         grupos = clusterizar(embeddings)
         print(f"📊 {len(grupos)} enfoques detectados")
     
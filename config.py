@@ -2,14 +2,65 @@
 UMBRAL_CLUSTER = 0.63
 UMBRAL_DUPLICADO = 0.87
 UMBRAL_AGRUPACION_MIN = 0.5
+AGRUPACION_MINIMA = "voraz"  # sin clusters claros: "voraz" (como siempre) o "componentes" (conexas del grafo)
 MAX_NOTICIAS_FEED_ES = 8
 MAX_NOTICIAS_FEED_INT = 30
 MAX_NOTICIAS_TOTAL = 300
 MAX_NOTICIAS_INTERNACIONAL = 40  # ✅ REDUCIDO DE 150 A 30
 CACHE_EMBEDDINGS = True
-CACHE_FILE = "embeddings_cache.pkl"
+MODELO_EMBEDDINGS = "all-MiniLM-L6-v2"
+BACKEND_EMBEDDINGS = "torch"  # "torch", "onnx" u "onnx-int8" (ver paridad_embeddings.py)
+ONNX_INT8_FICHERO = "onnx/model_qint8_avx2.onnx"  # variante cuantizada publicada con el modelo
+TOKENS_POR_LOTE = 512  # textos x tokens del más largo por lote (medido en CPU: más grande rinde menos)
+MAX_LOTE_CODIFICAR = 256
+CODIFICACION_EN_PROCESOS = True  # relleno masivo: nº de procesos (True = uno por núcleo, 0 = nunca)
+MIN_TEXTOS_EN_PROCESOS = 1000  # fallos de caché a partir de los que se usa; las ejecuciones normales no llegan
+TEXTOS_POR_TAREA = 256
+PUERTO_SERVICIO_EMBEDDINGS = 8377  # servicio_embeddings.py (solo 127.0.0.1)
+TIMEOUT_SERVICIO_EMBEDDINGS = 30  # segundos; sin servicio se codifica en el propio proceso
+REFERENCIAS_FILE = "referencias_embeddings.npz"  # frases de sesgo ya codificadas
+CACHE_FILE = "embeddings_cache.pkl"  # caché antigua, se migra al almacén la primera vez
+EMBEDDINGS_DIR = "embeddings_almacen"  # matriz mapeada en memoria (almacen_embeddings.py)
+EMBEDDINGS_DTYPE = "float32"  # "float16" reduce a la mitad disco y memoria
+EMBEDDINGS_MAX_ENTRADAS = 200000  # presupuesto del almacén (~300 MB en float32); None = sin límite
+EMBEDDINGS_TTL_DIAS = 30  # se expulsan los títulos sin usar en este tiempo; None = nunca
 LOG_FILE = "prisma.log"
 
+# ========== DESCARGA DE FEEDS ==========
+TIMEOUT_FEED = 15  # segundos por petición
+ESTADO_FEEDS_FILE = "feeds_estado.json"  # ETag / Last-Modified / hash por medio
+CACHE_NOTICIAS_FILE = "feeds_noticias_cache.json"  # hash del cuerpo -> noticias ya normalizadas
+MOTOR_DESCARGA = "hilos"  # "hilos" (ThreadPoolExecutor) o "async" (asyncio + aiohttp)
+TIMEOUT_DESCARGA_GLOBAL = 120  # segundos para todo el lote (solo motor async)
+MAX_CONEXIONES = 30
+MAX_CONEXIONES_POR_HOST = 4
+PARSER_FEEDS = "streaming"  # "streaming" (parser_streaming.py) o "feedparser"
+PARSEO_EN_PROCESOS = 0  # nº de procesos para parsear (0 = en los hilos de descarga, True = uno por núcleo)
+ARCHIVO_FEEDS_DIR = "archivo_feeds"  # respuestas grabadas con --grabar
+PIPELINE_PARALELO = True  # descargas española e internacional a la vez, codificando según llegan
+
+# ========== ARTÍCULOS YA VISTOS ==========
+VISTOS_FILE = "articulos_vistos.npz"  # hashes de URLs canónicas (vistos.py)
+VISTOS_HORAS_GENERACION = 24
+VISTOS_GENERACIONES = 7  # un artículo se olvida tras una semana sin aparecer
+
+# ========== HISTORIAS ENTRE EJECUCIONES ==========
+HISTORIAS_PERSISTENTES = True  # agrupar en historias guardadas (historias.py) en vez de desde cero
+HISTORIAS_FILE = "historias.npz"
+HISTORIAS_HORAS_RETIRO = 48  # una historia sin noticias en este tiempo se retira
+
+# ========== PLANIFICADOR DE FEEDS ==========
+PLANIFICACION_ADAPTATIVA = True
+PLANIFICADOR_FILE = "feeds_planificador.json"
+ESPERA_MAXIMA_FEED = 24  # horas; pasado este tiempo el feed se consulta siempre
+NUEVOS_MINIMOS_CONSULTA = 0.5  # noticias nuevas esperadas para consultar un feed
+
+# ========== SALUD DE FEEDS (CIRCUIT BREAKER) ==========
+SALUD_FEEDS_FILE = "feeds_salud.json"
+FALLOS_APERTURA_CIRCUITO = 3  # fallos consecutivos para dejar de consultar un feed
+BACKOFF_BASE_HORAS = 2  # primera espera; se duplica con cada sondeo fallido
+BACKOFF_MAX_HORAS = 48
+
 # ✅ NUEVO: Lista negra de medios que rara vez hablan de España
 MEDIOS_SOLO_LOCALES = ["La Nación AR", "Folha Brasil", "Clarin", "El Tiempo CO", "Infobae América"]
 
@@ -75,6 +126,11 @@ KEYWORDS_ESPANA = [
     "رئيس الوزراء الإسباني", "الحكومة الإسبانية",
 ]
 
+# Patrones extra (regex) que no son una palabra clave literal
+PATRONES_ESPANA = [
+    r'\besp[aá]ñol\b', r'pedro sánchez', r'\bfeijóo\b', r'\bvox\b', r'\bpsoe\b', r'\bpp\b',
+]
+
 # Stopwords
 STOPWORDS = set([
     "el","la","los","las","un","una","unos","unas","de","del","al","a","en","por","para","con","sin",
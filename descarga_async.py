@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Motor de descarga asíncrono (asyncio + aiohttp)
+
+Reutiliza conexiones keep-alive por host (varios feeds comparten dominio,
+p. ej. elpais.com o uecdn.es), cachea el DNS y limita la concurrencia por
+host. Cada petición tiene su propio timeout y el lote entero uno global,
+así un feed colgado no retiene al resto.
+"""
+
+import asyncio
+import logging
+import time
+
+from config import TIMEOUT_FEED, TIMEOUT_DESCARGA_GLOBAL, MAX_CONEXIONES, MAX_CONEXIONES_POR_HOST
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def disponible():
+    return aiohttp is not None
+
+
+async def _descargar(sesion, url, cabeceras):
+    """Una petición: (status, cuerpo, cabeceras)"""
+    async with sesion.get(url, headers=cabeceras) as respuesta:
+        if respuesta.status == 304:
+            cuerpo = b""
+        else:
+            respuesta.raise_for_status()
+            cuerpo = await respuesta.read()
+        return respuesta.status, cuerpo, {k.lower(): v for k, v in respuesta.headers.items()}
+
+
+def _llamar(al_terminar, medio, resultado, latencia, ultimo=True):
+    try:
+        return al_terminar(medio, resultado, latencia, ultimo) is not False
+    except Exception as e:
+        logging.error(f"Error procesando entradas de {medio}: {e}")
+        return True
+
+
+async def _descargar_y_procesar(sesion, medio, url, cabeceras, max_intentos, al_terminar, despachados):
+    inicio = time.monotonic()
+    bucle = asyncio.get_running_loop()
+    for intento in range(max_intentos):
+        ultimo = intento == max_intentos-1
+        try:
+            resultado = await _descargar(sesion, url, cabeceras)
+        except Exception as e:
+            if not ultimo:
+                await asyncio.sleep(1)
+                continue
+            logging.error(f"Error feed {medio} tras {max_intentos} intentos: {e}")
+            resultado = e
+        # El parseo va a un hilo para no bloquear el bucle con trabajo de CPU
+        despachados.add(medio)
+        if await bucle.run_in_executor(None, _llamar, al_terminar, medio, resultado, time.monotonic() - inicio, ultimo):
+            return
+        # Cuerpo mal formado rechazado: se vuelve a pedir, como en el motor de hilos
+        despachados.discard(medio)
+        await asyncio.sleep(1)
+
+
+async def _descargar_todos(feeds_dict, cabeceras_por_medio, al_terminar, intentos_por_medio):
+    conector = aiohttp.TCPConnector(
+        limit=MAX_CONEXIONES,
+        limit_per_host=MAX_CONEXIONES_POR_HOST,
+        ttl_dns_cache=600,
+        keepalive_timeout=30,
+    )
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT_FEED, sock_connect=TIMEOUT_FEED / 3)
+    despachados = set()
+
+    async with aiohttp.ClientSession(connector=conector, timeout=timeout) as sesion:
+        tareas = {
+            asyncio.ensure_future(_descargar_y_procesar(
+                sesion, medio, url, cabeceras_por_medio.get(medio, {}), intentos_por_medio.get(medio, 2),
+                al_terminar, despachados
+            )): medio
+            for medio, url in feeds_dict.items()
+        }
+        _, pendientes = await asyncio.wait(tareas, timeout=TIMEOUT_DESCARGA_GLOBAL)
+
+        for tarea in pendientes:
+            medio = tareas[tarea]
+            tarea.cancel()
+            if medio not in despachados:
+                logging.warning(f"Feed {medio} cancelado por timeout global ({TIMEOUT_DESCARGA_GLOBAL}s)")
+                _llamar(al_terminar, medio, asyncio.TimeoutError("timeout global"), TIMEOUT_DESCARGA_GLOBAL)
+        if pendientes:
+            await asyncio.wait(pendientes)
+
+
+def descargar_feeds(feeds_dict, cabeceras_por_medio, al_terminar, intentos_por_medio=None):
+    """Descarga todos los feeds a la vez.
+
+    `al_terminar(medio, resultado, latencia, ultimo)` se llama, en un hilo
+    del executor por defecto, en cuanto termina cada feed, mientras los más
+    lentos siguen descargando. `resultado` es la tupla (status, cuerpo,
+    cabeceras) o la excepción si la descarga falló. Si devuelve False (p. ej.
+    feed mal formado y `ultimo` es False) el feed se vuelve a pedir.
+    """
+    if not feeds_dict:  # p. ej. el planificador los ha saltado todos
+        return
+    asyncio.run(_descargar_todos(feeds_dict, cabeceras_por_medio, al_terminar, intentos_por_medio or {}))
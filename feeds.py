@@ -100,3 +100,32 @@ feeds_internacionales = {
     "The Hindu (India)": "https://www.thehindu.com/news/feeder/default.rss",
     "Times of India": "https://timesofindia.indiatimes.com/rssfeedstopstories.cms"
 }
+
+# ========== CATÁLOGO DE FEEDS ==========
+# Metadatos por medio para el planificador (planificador.py). Los medios que
+# no aparecen usan CATALOGO_POR_DEFECTO.
+#   cadencia:  horas esperadas entre publicaciones (hasta que se aprende la real)
+#   prioridad: 1 (baja) - 3 (alta), pondera el reparto de MAX_NOTICIAS_TOTAL
+#   max_items: máximo de noticias por consulta (None = MAX_NOTICIAS_FEED_*)
+CATALOGO_POR_DEFECTO = {"cadencia": 1.0, "prioridad": 2, "max_items": None}
+
+catalogo_feeds = {
+    # Agencias y portadas de alta rotación
+    "Europa Press": {"cadencia": 0.1, "prioridad": 3, "max_items": 15},
+    "El País": {"cadencia": 0.25, "prioridad": 3, "max_items": 12},
+    "El Mundo": {"cadencia": 0.25, "prioridad": 3, "max_items": 12},
+    "ABC": {"cadencia": 0.25, "prioridad": 3, "max_items": 12},
+    "La Vanguardia": {"cadencia": 0.25, "prioridad": 3, "max_items": 12},
+    "RTVE": {"cadencia": 0.25, "prioridad": 3, "max_items": 12},
+    "eldiario.es": {"cadencia": 0.25, "prioridad": 3, "max_items": 12},
+    "20 Minutos": {"cadencia": 0.25, "prioridad": 2, "max_items": 10},
+    
+    # Revistas y blogs de baja frecuencia
+    "CTXT": {"cadencia": 12, "prioridad": 1},
+    "Jacobin ES": {"cadencia": 12, "prioridad": 1},
+    "Yorokobu": {"cadencia": 24, "prioridad": 1},
+    "Microsiervos": {"cadencia": 12, "prioridad": 1},
+    "OpenDemocracy": {"cadencia": 12, "prioridad": 1},
+    "Scientific American": {"cadencia": 12, "prioridad": 1},
+    "Nature News": {"cadencia": 24, "prioridad": 1},
+}
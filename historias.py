@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Historias que se siguen de una ejecución a otra
+
+Una historia es un grupo de noticias sobre el mismo asunto que sobrevive
+entre ejecuciones: guarda su identificador estable, la suma de los
+embeddings de sus miembros (de ahí el centroide), los hashes de URL de
+esos miembros (vistos.hash_url), cuándo se vio por primera y por última
+vez y el titular que se le puso al aparecer en portada.
+
+En cada ejecución solo se puntúan las noticias que no son ya miembros de
+ninguna historia: se unen a la de centroide más parecido si supera
+UMBRAL_CLUSTER (el mismo criterio voraz de clusterizar) o abren una
+nueva. Las historias sin noticias durante HISTORIAS_HORAS_RETIRO horas
+se retiran al cargar.
+"""
+
+import os
+import time
+import logging
+
+import numpy as np
+
+from config import (
+    HISTORIAS_FILE, HISTORIAS_HORAS_RETIRO, UMBRAL_CLUSTER,
+    MODELO_EMBEDDINGS, BACKEND_EMBEDDINGS
+)
+from persistencia import guardar_npz
+from similitud import Centroides
+from vistos import hash_url
+
+IDENTIDAD = f"{MODELO_EMBEDDINGS}|{BACKEND_EMBEDDINGS}"
+
+
+class AlmacenHistorias:
+    def __init__(self, ruta=HISTORIAS_FILE, ahora=None):
+        self.ruta = ruta
+        self.ahora = ahora or time.time()
+        self._vaciar()
+        if os.path.exists(ruta):
+            try:
+                self._cargar()
+            except Exception as e:
+                logging.warning(f"Error cargando {ruta}: {e}")
+                self._vaciar()
+
+    def _vaciar(self):
+        self.centroides = None
+        self.ids, self.titulares, self.miembros = [], [], []
+        self.primera, self.ultima = [], []
+        self.miembro_de = {}  # hash de URL -> índice de historia
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cargar(self):
+        with np.load(self.ruta) as datos:
+            if str(datos["identidad"]) != IDENTIDAD:
+                logging.info("🔁 Historias de otro modelo de embeddings: se empieza de cero")
+                return
+            vigentes = np.flatnonzero(self.ahora - datos["ultima"] < HISTORIAS_HORAS_RETIRO * 3600)
+            indptr, claves = datos["indptr"], datos["claves"]
+            self.centroides = Centroides(datos["sumas"].shape[1], max(64, len(vigentes)))
+            for k in vigentes:
+                self._agregar(str(datos["ids"][k]), str(datos["titulares"][k]),
+                              claves[indptr[k]:indptr[k + 1]].tolist(), float(datos["primera"][k]),
+                              float(datos["ultima"][k]), datos["sumas"][k], int(datos["tamanos"][k]))
+            retiradas = len(datos["ids"]) - len(vigentes)
+        logging.info(f"📚 {len(self)} historias cargadas ({retiradas} retiradas)")
+
+    def _agregar(self, ident, titular, miembros, primera, ultima, suma, tamano=1):
+        k = self.centroides.nuevo(suma, tamano)
+        self.ids.append(ident)
+        self.titulares.append(titular)
+        self.miembros.append(miembros)
+        self.primera.append(primera)
+        self.ultima.append(ultima)
+        for clave in miembros:
+            self.miembro_de[clave] = k
+        return k
+
+    def agrupar(self, noticias, embeddings):
+        """(grupos, ids): índices de `noticias` por historia, solo las historias
+        con al menos dos noticias en esta ejecución y de mayor a menor, como
+        los de clusterizar(), y el identificador de cada una"""
+        if self.centroides is None and len(embeddings):
+            self.centroides = Centroides(embeddings.shape[1])
+        por_historia = {}
+        nuevas = 0
+        for i, (n, emb) in enumerate(zip(noticias, embeddings)):
+            clave = hash_url(n["link"])
+            k = self.miembro_de.get(clave)
+            if k is None:
+                nuevas += 1
+                if len(self.centroides):
+                    scores = self.centroides.puntuar(emb)
+                    k = int(np.argmax(scores))
+                    if scores[k] <= UMBRAL_CLUSTER:
+                        k = None
+                if k is None:
+                    k = self._agregar(f"{clave:016x}", "", [clave], self.ahora, self.ahora, emb)
+                else:
+                    self.centroides.sumar(k, emb)
+                    self.miembros[k].append(clave)
+                    self.miembro_de[clave] = k
+            self.ultima[k] = self.ahora
+            por_historia.setdefault(k, []).append(i)
+
+        # Orden estable: a igual tamaño, la historia que aparece antes en `noticias`
+        historias = sorted(((k, g) for k, g in por_historia.items() if len(g) >= 2),
+                           key=lambda x: len(x[1]), reverse=True)
+        logging.info(f"📚 {nuevas} noticias nuevas asignadas; {len(historias)} historias con varias noticias")
+        return [g for _, g in historias], [self.ids[k] for k, _ in historias]
+
+    def titular(self, ident, generar):
+        """Titular fijo de la historia: el primero que se le genera con `generar()`"""
+        k = self.ids.index(ident)
+        if not self.titulares[k]:
+            self.titulares[k] = generar()
+        return self.titulares[k]
+
+    def guardar(self):
+        if self.centroides is None:
+            return
+        n = len(self)
+        guardar_npz(
+            self.ruta,
+            identidad=IDENTIDAD,
+            ids=np.array(self.ids, dtype=str),
+            titulares=np.array(self.titulares, dtype=str),
+            sumas=self.centroides.sumas[:n],
+            tamanos=self.centroides.tamanos[:n],
+            primera=np.array(self.primera, dtype=np.float64),
+            ultima=np.array(self.ultima, dtype=np.float64),
+            indptr=np.concatenate([[0], np.cumsum([len(m) for m in self.miembros])]).astype(np.int64),
+            claves=np.array([c for m in self.miembros for c in m], dtype=np.uint64),
+        )
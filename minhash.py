@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Índice MinHash/LSH de titulares casi idénticos
+
+La comprobación de texto de deduplicar_noticias (SequenceMatcher) cuesta
+una comparación por cada noticia ya aceptada. Este índice resume cada
+titular en PERMUTACIONES mínimos de sus trigramas de caracteres y los
+reparte en BANDAS cubetas de FILAS valores: dos titulares solo se
+comparan de verdad si coinciden en alguna cubeta. Con 32 bandas de 3
+filas, un par con Jaccard de trigramas de 0,6 sale como candidato con
+probabilidad > 0,999 y uno de 0,15 con ≈ 0,1. Los que SequenceMatcher da
+por duplicados (ratio > 0,8, p. ej. el mismo teletipo de Europa Press en
+varios medios) suelen pasar de 0,7; los titulares sin relación no llegan
+a 0,15.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+SHINGLE = 3
+PERMUTACIONES = 96
+BANDAS = 32
+FILAS = PERMUTACIONES // BANDAS
+
+# Funciones hash h(x) = (a·x + b) mod 2^64 >> 32, fijas para que las firmas
+# no dependan del proceso
+_rng = np.random.default_rng(20240521)
+_A = _rng.integers(1, 2**63, PERMUTACIONES, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, PERMUTACIONES, dtype=np.uint64)
+
+
+def trigramas(texto):
+    """Códigos únicos (uint64) de los shingles de caracteres de `texto`"""
+    cod = np.frombuffer(texto.lower().encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(cod) < SHINGLE:
+        cod = np.concatenate([cod, np.zeros(SHINGLE - len(cod), dtype=np.uint64)])
+    # Cada punto de código cabe en 21 bits: tres por shingle, sin colisiones
+    codigos = cod[:len(cod) - SHINGLE + 1].copy()
+    for k in range(1, SHINGLE):
+        codigos = (codigos << np.uint64(21)) | cod[k:len(cod) - SHINGLE + 1 + k]
+    return np.unique(codigos)
+
+
+def firma(texto):
+    """Firma MinHash (PERMUTACIONES valores) de `texto`; None si está vacío"""
+    if not texto:
+        return None
+    codigos = trigramas(texto)
+    return ((_A[:, None] * codigos[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+class IndiceMinHash:
+    """Cubetas LSH de firmas: candidatos() devuelve, en orden de inserción, los
+    identificadores que comparten alguna banda con el texto"""
+
+    def __init__(self):
+        self.cubetas = defaultdict(list)
+
+    @staticmethod
+    def _claves(f):
+        return [(b, banda.tobytes()) for b, banda in enumerate(f.reshape(BANDAS, FILAS))]
+
+    def agregar(self, ident, texto, f=None):
+        f = firma(texto) if f is None else f
+        if f is None:
+            return
+        for clave in self._claves(f):
+            self.cubetas[clave].append(ident)
+
+    def candidatos(self, texto, f=None):
+        f = firma(texto) if f is None else f
+        if f is None:
+            return []
+        vistos = set()
+        for clave in self._claves(f):
+            vistos.update(self.cubetas.get(clave, ()))
+        return sorted(vistos)
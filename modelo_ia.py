@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Modelo de embeddings bajo demanda
+
+El SentenceTransformer (y con él torch) solo se importa y se carga la
+primera vez que alguien pide el modelo; importar los módulos de Prisma o
+generar páginas a partir de cachés no lo toca. Los embeddings de frases
+fijas (las referencias de sesgo) se guardan en disco con la huella de las
+frases y del modelo, así tampoco hace falta el modelo para obtenerlos.
+
+El backend del codificador se elige con BACKEND_EMBEDDINGS: "torch" (el
+de siempre), "onnx" (ONNX Runtime) u "onnx-int8" (pesos cuantizados a
+int8, lo más rápido en CPU). Los dos últimos necesitan
+`pip install "sentence-transformers[onnx]"`; paridad_embeddings.py mide
+cuánto se desvían del de referencia antes de activarlos.
+
+codificar() es la entrada común: si el proceso ha activado usar_servicio()
+(los buscadores de línea de comandos) prueba antes el servicio local de
+servicio_embeddings.py, que tiene el modelo ya cargado. En proceso, los
+textos pasan por codificar_en_lotes(): los repetidos se codifican una vez
+y el resto se agrupa por longitud en tokens, con lotes tanto más grandes
+cuanto más cortos son los textos, para no gastar cómputo en relleno.
+Para rellenar una caché vacía (modelo o feeds nuevos, importaciones
+históricas) codificar_en_procesos() reparte los textos entre varios
+procesos, cada uno con su propia copia del modelo.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from config import (
+    MODELO_EMBEDDINGS, BACKEND_EMBEDDINGS, ONNX_INT8_FICHERO, EMBEDDINGS_DIR,
+    TOKENS_POR_LOTE, MAX_LOTE_CODIFICAR, TEXTOS_POR_TAREA
+)
+from persistencia import guardar_npz
+
+# Argumentos de SentenceTransformer para cada backend; todos exponen el
+# mismo encode(textos, batch_size=..., show_progress_bar=...)
+BACKENDS = {
+    "torch": {},
+    "onnx": {"backend": "onnx"},
+    "onnx-int8": {"backend": "onnx", "model_kwargs": {"file_name": ONNX_INT8_FICHERO}},
+}
+
+_modelo = None
+_lock = threading.Lock()
+_usar_servicio = False
+
+
+def crear_modelo(backend=BACKEND_EMBEDDINGS):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    from sentence_transformers import SentenceTransformer
+    logging.info(f"🔄 Cargando modelo {MODELO_EMBEDDINGS} ({backend})...")
+    try:
+        return SentenceTransformer(MODELO_EMBEDDINGS, **BACKENDS[backend])
+    except ImportError as e:
+        raise ImportError(f"El backend {backend} necesita `pip install \"sentence-transformers[onnx]\"`: {e}") from e
+
+
+def obtener_modelo():
+    """Instancia única del modelo, creada en la primera llamada"""
+    global _modelo
+    if _modelo is None:
+        with _lock:
+            if _modelo is None:
+                _modelo = crear_modelo()
+    return _modelo
+
+
+def usar_servicio(activar=True):
+    """Encamina codificar() al servicio local cuando esté en marcha"""
+    global _usar_servicio
+    _usar_servicio = activar
+
+
+def longitudes_tokens(modelo, textos):
+    """Tokens de cada texto según el tokenizador del modelo (palabras si no tiene)"""
+    tokenizador = getattr(modelo, "tokenizer", None)
+    if tokenizador is not None:
+        try:
+            ids = tokenizador(textos, add_special_tokens=True, truncation=True,
+                              max_length=getattr(modelo, "max_seq_length", None))["input_ids"]
+            return np.array([len(i) for i in ids])
+        except Exception:
+            pass
+    return np.array([len(t.split()) + 2 for t in textos])
+
+
+def lotes_por_longitud(longitudes, max_lote=MAX_LOTE_CODIFICAR, tokens_por_lote=TOKENS_POR_LOTE):
+    """Índices agrupados en lotes de longitud parecida; cada lote se llena hasta
+    que (textos x longitud del más largo) alcanza `tokens_por_lote`"""
+    lotes, lote = [], []
+    for i in np.argsort(longitudes, kind="stable"):
+        # En orden creciente, el último en entrar es el más largo del lote
+        if lote and (len(lote) >= max_lote or (len(lote) + 1) * longitudes[i] > tokens_por_lote):
+            lotes.append(lote)
+            lote = []
+        lote.append(i)
+    if lote:
+        lotes.append(lote)
+    return lotes
+
+
+def codificar_en_lotes(modelo, textos, max_lote=MAX_LOTE_CODIFICAR):
+    """encode() de `textos` sin repetidos, por lotes de longitud similar y
+    devuelto en el orden original"""
+    unicos = list(dict.fromkeys(textos))
+    if not unicos:
+        return np.empty((0, 0), dtype=np.float32)
+    posiciones = {texto: i for i, texto in enumerate(unicos)}
+    salida = None
+    for lote in lotes_por_longitud(longitudes_tokens(modelo, unicos), max_lote):
+        emb = modelo.encode([unicos[i] for i in lote], batch_size=len(lote),
+                            show_progress_bar=False, normalize_embeddings=True)
+        if salida is None:
+            salida = np.empty((len(unicos), emb.shape[1]), dtype=np.float32)
+        salida[lote] = emb
+    return salida[[posiciones[t] for t in textos]]
+
+
+def codificar(textos, batch_size=MAX_LOTE_CODIFICAR):
+    """Embeddings normalizados (norma 1) de `textos`, del servicio local si
+    procede o del modelo en proceso. `batch_size` es el tope de textos por lote"""
+    if _usar_servicio:
+        from servicio_embeddings import codificar_remoto
+        emb = codificar_remoto(textos)
+        if emb is not None:
+            return emb
+    return codificar_en_lotes(obtener_modelo(), list(textos), batch_size)
+
+
+def dimension_embeddings():
+    """Dimensión de los embeddings del modelo (lo carga si no lo estaba)"""
+    return obtener_modelo().get_sentence_embedding_dimension()
+
+
+def _iniciar_proceso():
+    # Un hilo de torch por proceso: el paralelismo lo ponen los procesos
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    obtener_modelo()
+
+
+def _codificar_tarea(textos):
+    return codificar_en_lotes(obtener_modelo(), textos)
+
+
+def codificar_en_procesos(textos, procesos=None, al_terminar=None):
+    """Codifica `textos` repartidos entre `procesos` procesos (None = uno por
+    núcleo). Cada tanda terminada se entrega a `al_terminar(textos, emb)` en
+    cuanto llega, sin esperar al resto."""
+    # Por longitud antes de trocear: cada tanda reúne textos de tamaño parecido
+    unicos = sorted(dict.fromkeys(textos), key=len)
+    tandas = [unicos[i:i + TEXTOS_POR_TAREA] for i in range(0, len(unicos), TEXTOS_POR_TAREA)]
+    # spawn: el proceso padre puede tener hilos en marcha y torch ya cargado
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=_iniciar_proceso) as pool:
+        futuros = {pool.submit(_codificar_tarea, tanda): tanda for tanda in tandas}
+        for futuro in as_completed(futuros):
+            al_terminar(futuros[futuro], futuro.result())
+    logging.info(f"🧠 {len(unicos)} textos codificados en {len(tandas)} tandas ({procesos or os.cpu_count()} procesos)")
+
+
+def similitudes_servicio(consulta, titulos):
+    """Similitud de la consulta con cada título según la matriz de noticias que
+    el servicio tiene en memoria; None si no está activo o no coinciden"""
+    if not _usar_servicio:
+        return None
+    from servicio_embeddings import similitudes_remotas
+    return similitudes_remotas(consulta, titulos)
+
+
+def directorio_embeddings(backend=BACKEND_EMBEDDINGS):
+    """Cada backend guarda sus embeddings aparte: no son intercambiables"""
+    return EMBEDDINGS_DIR if backend == "torch" else f"{EMBEDDINGS_DIR}-{backend}"
+
+
+def huella_frases(grupos):
+    """Huella de {nombre: [frases]} y del modelo y backend que las codifican"""
+    datos = json.dumps(
+        {"modelo": MODELO_EMBEDDINGS, "backend": BACKEND_EMBEDDINGS, "normalizado": True, "frases": grupos},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+def embeddings_frases(grupos, ruta):
+    """{nombre: matriz} para {nombre: [frases]}, leída de `ruta` si la huella coincide"""
+    huella = huella_frases(grupos)
+    if os.path.exists(ruta):
+        try:
+            with np.load(ruta) as datos:
+                if str(datos["huella"]) == huella:
+                    return {nombre: datos[nombre] for nombre in grupos}
+        except Exception as e:
+            logging.warning(f"Error cargando {ruta}: {e}")
+
+    modelo = obtener_modelo()
+    matrices = {
+        nombre: modelo.encode(frases, show_progress_bar=False, normalize_embeddings=True)
+        for nombre, frases in grupos.items()
+    }
+    guardar_npz(ruta, huella=huella, **matrices)
+    return matrices
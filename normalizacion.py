@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Parseo y normalización de las entradas de los feeds
+
+Funciones puras y sin dependencias pesadas (no cargan el modelo), para que
+los procesos de ParseoEnProcesos puedan importarlas sin coste.
+"""
+
+import re
+import html
+import time
+import logging
+import unicodedata
+import urllib.parse
+from collections import Counter
+from functools import lru_cache
+
+import feedparser
+
+import parser_streaming
+from config import KEYWORDS_ESPANA, PATRONES_ESPANA, PARSER_FEEDS
+
+
+def limpiar_html(texto):
+    texto = html.unescape(texto)
+    texto = re.sub(r'<.*?>', '', texto)
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def extraer_fecha_noticia(entry):
+    try:
+        if hasattr(entry, 'published_parsed') and entry.published_parsed:
+            return time.mktime(entry.published_parsed)
+        elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
+            return time.mktime(entry.updated_parsed)
+    except:
+        pass
+    return time.time()
+
+
+# Parámetros que no cambian el artículo: campañas, clics de redes, AMP...
+PARAMETROS_SEGUIMIENTO = re.compile(
+    r'^(utm_\w+|fbclid|gclid|dclid|msclkid|igshid|mc_cid|mc_eid|_ga|_gl|ocid|cmpid|'
+    r'ref|ref_src|referrer|ns_\w+|at_\w+|int_\w+|sr_share|amp|outputtype|__twitter_impression)$'
+)
+SUFIJOS_AMP = ("/amp", ".amp")
+
+
+@lru_cache(maxsize=4096)
+def canonizar_url(url):
+    """Forma canónica de un enlace para compararlo con otros: https, host en
+    minúsculas sin www/amp/m., sin fragmento, sin parámetros de seguimiento
+    (los demás ordenados) y sin la variante AMP de la ruta"""
+    try:
+        partes = urllib.parse.urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    if partes.scheme not in ("http", "https") or not partes.hostname:
+        return url.strip()
+    
+    host = partes.hostname
+    for prefijo in ("www.", "amp.", "m."):
+        if host.startswith(prefijo) and host.count(".") > 1:
+            host = host[len(prefijo):]
+            break
+    if partes.port and partes.port not in (80, 443):
+        host = f"{host}:{partes.port}"
+    
+    ruta = partes.path or "/"
+    if ruta.startswith("/amp/"):
+        ruta = ruta[4:]
+    for sufijo in SUFIJOS_AMP:
+        if ruta.endswith(sufijo) or ruta.endswith(sufijo + "/"):
+            ruta = ruta[:ruta.rindex(sufijo)] or "/"
+            break
+    if len(ruta) > 1:
+        ruta = ruta.rstrip("/")
+    
+    parametros = sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(partes.query, keep_blank_values=True)
+        if not PARAMETROS_SEGUIMIENTO.match(k.lower())
+    )
+    return urllib.parse.urlunsplit(("https", host, ruta, urllib.parse.urlencode(parametros), ""))
+
+
+def entradas_feed(feed, max_entradas=None):
+    """Reduce las entradas de feedparser a registros compactos, las más recientes primero"""
+    entradas = []
+    for entry in sorted(feed.entries, key=extraer_fecha_noticia, reverse=True)[:max_entradas]:
+        if "title" in entry and "link" in entry:
+            entradas.append({
+                "title": entry.title,
+                "link": entry.link,
+                "summary": entry.summary if hasattr(entry, "summary") else "",
+                "fecha": extraer_fecha_noticia(entry)
+            })
+    return entradas
+
+
+def parsear_cuerpo(cuerpo, cabeceras, max_entradas=None):
+    """Entradas compactas del cuerpo descargado y si el feed está mal formado.
+    
+    Con PARSER_FEEDS = "streaming" se usa el parser incremental y feedparser
+    solo queda para los feeds con XML no válido.
+    """
+    entradas = parser_streaming.parsear(cuerpo, max_entradas) if PARSER_FEEDS == "streaming" else None
+    if entradas is not None:
+        return entradas, False
+    feed = feedparser.parse(cuerpo, response_headers=cabeceras)
+    return entradas_feed(feed, max_entradas), bool(feed.bozo)
+
+
+def _necesita_limite(keyword):
+    """Las escrituras latinas, cirílicas y griegas separan palabras con
+    espacios; en chino, japonés, coreano o árabe se busca la subcadena"""
+    return all(
+        unicodedata.name(c, "").startswith(("LATIN", "CYRILLIC", "GREEK"))
+        for c in keyword if c.isalpha()
+    )
+
+
+def _regex_trie(palabras):
+    """Regex equivalente a la alternancia de `palabras` pero factorizada por
+    prefijos comunes, para que el motor descarte cada posición en el primer
+    carácter en vez de probar todas las alternativas"""
+    trie = {}
+    for palabra in palabras:
+        nodo = trie
+        for c in palabra:
+            nodo = nodo.setdefault(c, {})
+        nodo[""] = True
+    
+    def construir(nodo):
+        fin = "" in nodo
+        ramas = [re.escape(c) + construir(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not ramas:
+            return ""
+        cuerpo = ramas[0] if len(ramas) == 1 and len(ramas[0]) == 1 else "(?:" + "|".join(ramas) + ")"
+        return cuerpo + "?" if fin else cuerpo
+    
+    return construir(trie)
+
+
+class DetectorEspana:
+    """Busca menciones de España con una sola regex compilada a partir de
+    KEYWORDS_ESPANA y PATRONES_ESPANA.
+    
+    Las palabras clave en escritura latina/cirílica deben empezar en límite
+    de palabra ("valencia" ya no salta con "ambivalencia") pero admiten
+    sufijos ("spanisch" encuentra "spanischen").
+    """
+    def __init__(self, keywords=KEYWORDS_ESPANA, patrones=PATRONES_ESPANA):
+        keywords = {k.lower() for k in keywords}
+        con_limite = [k for k in keywords if _necesita_limite(k)]
+        sin_limite = [k for k in keywords if not _necesita_limite(k)]
+        alternativas = list(patrones)
+        if con_limite:
+            alternativas.append(r'(?<!\w)' + _regex_trie(con_limite))
+        if sin_limite:
+            alternativas.append(_regex_trie(sin_limite))
+        self.regex = re.compile("|".join(alternativas))
+    
+    def buscar(self, texto):
+        """Primera palabra clave encontrada en el texto, o None"""
+        if not texto:
+            return None
+        m = self.regex.search(texto.lower())
+        return m.group(0) if m else None
+    
+    def filtrar(self, textos):
+        """Palabra clave (o None) para cada texto de un feed"""
+        buscar = self.regex.search
+        resultado = []
+        for texto in textos:
+            m = buscar(texto.lower()) if texto else None
+            resultado.append(m.group(0) if m else None)
+        return resultado
+
+
+detector_espana = DetectorEspana()
+
+
+def menciona_espana(texto):
+    """Detecta si el texto menciona España (versión multilingüe mejorada)"""
+    return detector_espana.buscar(texto) is not None
+
+
+def normalizar_entradas(medio, entradas, filtrar_espana=False):
+    """Limpia las entradas de un medio y las convierte en noticias"""
+    noticias = []
+    for entry in entradas:
+        noticias.append({
+            "medio": medio,
+            "titulo": limpiar_html(entry["title"]),
+            "resumen": limpiar_html(entry["summary"]),
+            "link": entry["link"].strip(),
+            "fecha": entry["fecha"]
+        })
+    
+    if filtrar_espana:
+        coincidencias = detector_espana.filtrar([n["titulo"] + " " + n["resumen"] for n in noticias])
+        noticias = [n for n, keyword in zip(noticias, coincidencias) if keyword]
+        logging.debug(f"{medio}: {len(noticias)} noticias mencionan España ({Counter(k for k in coincidencias if k)})")
+    return noticias
+
+
+def parsear_y_normalizar(medio, cuerpo, cabeceras, max_entradas, filtrar_espana, max_normalizar=None):
+    """Trabajo completo de un feed para ejecutar en otro proceso. Se parsean
+    `max_entradas` pero solo se normalizan las `max_normalizar` primeras"""
+    entradas, bozo = parsear_cuerpo(cuerpo, cabeceras, max_entradas)
+    return entradas, bozo, normalizar_entradas(medio, entradas[:max_normalizar], filtrar_espana)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Paridad de backends de embeddings
+Uso: python paridad_embeddings.py [onnx onnx-int8 ...]
+
+Codifica los titulares de noticias_cache.json con el backend de referencia
+(torch) y con cada candidato, y compara:
+  - deriva coseno por titular (1 - cos entre ambos embeddings)
+  - pares cuya decisión de duplicado (UMBRAL_DUPLICADO) o de agrupación
+    (UMBRAL_CLUSTER) cambia de lado
+  - grupos de clusterizar(): nº de grupos y acuerdo por pares (índice de Rand)
+  - tiempo de carga y de codificación
+"""
+
+import sys
+import json
+import time
+import numpy as np
+
+from config import *
+from modelo_ia import BACKENDS, crear_modelo
+from rss_prisma import clusterizar
+from similitud import normalizar, similitudes
+
+REFERENCIA = "torch"
+
+
+def codificar(backend, titulos):
+    inicio = time.perf_counter()
+    modelo = crear_modelo(backend)
+    carga = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    emb = normalizar(modelo.encode(titulos, batch_size=32, show_progress_bar=False))
+    return emb, carga, time.perf_counter() - inicio
+
+
+def etiquetas(grupos, n):
+    """Grupo de cada noticia (-1 si no está en ninguno)"""
+    asignacion = np.full(n, -1)
+    for g, grupo in enumerate(grupos):
+        asignacion[grupo] = g
+    return asignacion
+
+
+def acuerdo_rand(a, b):
+    """Fracción de pares de noticias en los que ambas agrupaciones coinciden"""
+    mismo_a = (a[:, None] == a[None, :]) & (a[:, None] >= 0)
+    mismo_b = (b[:, None] == b[None, :]) & (b[:, None] >= 0)
+    superior = np.triu_indices(len(a), k=1)
+    return float((mismo_a[superior] == mismo_b[superior]).mean()) if len(a) > 1 else 1.0
+
+
+def cambios_umbral(sims_ref, sims, umbral):
+    superior = np.triu_indices(len(sims_ref), k=1)
+    return int(((sims_ref[superior] > umbral) != (sims[superior] > umbral)).sum())
+
+
+def main():
+    candidatos = sys.argv[1:] or [b for b in BACKENDS if b != REFERENCIA]
+
+    try:
+        with open("noticias_cache.json", "r", encoding="utf-8") as f:
+            titulos = [n["titulo"] for n in json.load(f)]
+    except FileNotFoundError:
+        print("❌ No hay noticias en caché. Ejecuta primero rss_prisma.py")
+        sys.exit(1)
+    print(f"📰 {len(titulos)} titulares")
+
+    emb_ref, carga, tiempo = codificar(REFERENCIA, titulos)
+    sims_ref = similitudes(emb_ref, emb_ref)
+    grupos_ref = clusterizar(emb_ref)
+    etiquetas_ref = etiquetas(grupos_ref, len(titulos))
+    print(f"\n{REFERENCIA:10s} carga {carga:5.1f}s · codificación {tiempo:6.2f}s · {len(grupos_ref)} grupos")
+
+    for backend in candidatos:
+        try:
+            emb, carga, tiempo_b = codificar(backend, titulos)
+        except Exception as e:
+            print(f"{backend:10s} ❌ no disponible: {e}")
+            continue
+        deriva = 1 - np.sum(emb * emb_ref, axis=1)
+        sims = similitudes(emb, emb)
+        grupos = clusterizar(emb)
+
+        print(f"{backend:10s} carga {carga:5.1f}s · codificación {tiempo_b:6.2f}s "
+              f"(x{tiempo / max(tiempo_b, 1e-9):.1f}) · {len(grupos)} grupos")
+        print(f"           deriva coseno: media {deriva.mean():.2e} · p99 {np.percentile(deriva, 99):.2e} · máx {deriva.max():.2e}")
+        print(f"           pares que cambian: duplicado {cambios_umbral(sims_ref, sims, UMBRAL_DUPLICADO)} · "
+              f"cluster {cambios_umbral(sims_ref, sims, UMBRAL_CLUSTER)}")
+        print(f"           acuerdo de agrupación (Rand): {acuerdo_rand(etiquetas_ref, etiquetas(grupos, len(titulos))):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Parser incremental de RSS/Atom
+
+Alternativa ligera a feedparser: recorre el XML por eventos (XMLPullParser),
+se queda solo con título, enlace, resumen y fecha de cada entrada, libera
+cada elemento al terminarlo y deja de leer en cuanto tiene las N entradas
+más recientes. Devuelve los mismos registros compactos que entradas_feed().
+"""
+
+import time
+from datetime import datetime
+from email.utils import parsedate_tz, mktime_tz
+import xml.etree.ElementTree as ET
+
+TAM_BLOQUE = 16 * 1024
+
+# Solo cuentan los elementos de RSS 0.9x/2.0 (sin espacio de nombres), RSS
+# 1.0 y Atom: un <media:title> o <media:description> no es el título ni el
+# resumen de la entrada, igual que en feedparser
+ESPACIOS_FEED = ("", "http://purl.org/rss/1.0/", "http://www.w3.org/2005/Atom", "http://purl.org/atom/ns#")
+DC = "http://purl.org/dc/elements/1.1/"
+CONTENT = "http://purl.org/rss/1.0/modules/content/"
+
+
+def _etiquetas(*nombres, espacios=ESPACIOS_FEED):
+    return {f"{{{ns}}}{nombre}" if ns else nombre for ns in espacios for nombre in nombres}
+
+
+ETIQUETAS_ENTRADA = _etiquetas("item", "entry")
+ETIQUETAS_TITULO = _etiquetas("title")
+ETIQUETAS_ENLACE = _etiquetas("link")
+ETIQUETAS_GUID = _etiquetas("guid")
+ETIQUETAS_RESUMEN = _etiquetas("description", "summary")
+# Solo si no hay resumen, como feedparser
+ETIQUETAS_CONTENIDO = _etiquetas("content") | {f"{{{CONTENT}}}encoded"}
+ETIQUETAS_FECHA = [
+    etiqueta
+    for nombre in ("pubDate", "published", "issued", "date", "updated", "modified")
+    for etiqueta in sorted(_etiquetas(nombre, espacios=ESPACIOS_FEED + (DC,)))
+]
+ETIQUETAS_UTILES = ETIQUETAS_TITULO | ETIQUETAS_RESUMEN | ETIQUETAS_CONTENIDO | set(ETIQUETAS_FECHA)
+
+
+def _parsear_fecha(texto):
+    """Fecha RFC 822 (RSS) o ISO 8601 (Atom, dc:date) a timestamp"""
+    texto = texto.strip()
+    partes = parsedate_tz(texto)
+    if partes:
+        # Igual que extraer_fecha_noticia: struct_time UTC pasado por mktime
+        return time.mktime(time.gmtime(mktime_tz(partes)))
+    try:
+        fecha = datetime.fromisoformat(texto.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if fecha.tzinfo is not None:
+        return time.mktime(time.gmtime(fecha.timestamp()))
+    return time.mktime(fecha.timetuple())
+
+
+def _enlace(elem):
+    """<link>texto</link> en RSS; <link rel="alternate" href="..."/> en Atom.
+    Sin enlace vale el <guid> si es un permalink (isPermaLink no es "false")"""
+    alternativo = permalink = None
+    for hijo in elem:
+        if hijo.tag in ETIQUETAS_GUID:
+            if hijo.text and hijo.text.strip() and hijo.get("isPermaLink", "true") == "true":
+                permalink = permalink or hijo.text.strip()
+            continue
+        if hijo.tag not in ETIQUETAS_ENLACE:
+            continue
+        if hijo.text and hijo.text.strip():
+            return hijo.text.strip()
+        if hijo.get("href") and hijo.get("rel", "alternate") == "alternate":
+            return hijo.get("href")
+        alternativo = alternativo or hijo.get("href")
+    return alternativo or permalink
+
+
+def _entrada(elem):
+    campos = {}
+    for hijo in elem:
+        if hijo.tag in ETIQUETAS_UTILES and hijo.tag not in campos:
+            campos[hijo.tag] = hijo.text or ""
+
+    titulo = next((campos[t] for t in ETIQUETAS_TITULO if t in campos), None)
+    enlace = _enlace(elem)
+    if titulo is None or not enlace:
+        return None
+
+    resumen = next((campos[t] for t in ETIQUETAS_RESUMEN if t in campos), None)
+    if resumen is None:
+        resumen = next((campos[t] for t in ETIQUETAS_CONTENIDO if t in campos), "")
+
+    fecha = None
+    for etiqueta in ETIQUETAS_FECHA:
+        if campos.get(etiqueta):
+            fecha = _parsear_fecha(campos[etiqueta])
+            if fecha is not None:
+                break
+
+    return {
+        "title": titulo,
+        "link": enlace,
+        "summary": resumen,
+        "fecha": fecha if fecha is not None else time.time()
+    }
+
+
+def parsear(cuerpo, max_entradas=None):
+    """Entradas compactas del feed, las más recientes primero.
+
+    Si las entradas llegan ordenadas de más nueva a más antigua (lo normal)
+    el parseo se detiene al reunir `max_entradas`. Devuelve None si el XML
+    no es válido, para que el llamador recurra a feedparser.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    entradas = []
+    ordenadas = True
+    profundidad = 0
+
+    try:
+        for inicio in range(0, len(cuerpo), TAM_BLOQUE):
+            parser.feed(cuerpo[inicio:inicio + TAM_BLOQUE])
+            for evento, elem in parser.read_events():
+                if elem.tag not in ETIQUETAS_ENTRADA:
+                    continue
+                if evento == "start":
+                    profundidad += 1
+                    continue
+                profundidad -= 1
+                if profundidad:
+                    continue
+
+                entrada = _entrada(elem)
+                elem.clear()
+                if entrada is None:
+                    continue
+                if entradas and entrada["fecha"] > entradas[-1]["fecha"]:
+                    ordenadas = False
+                entradas.append(entrada)
+
+                if max_entradas and ordenadas and len(entradas) >= max_entradas:
+                    return entradas
+        parser.close()
+    except ET.ParseError:
+        return None
+
+    entradas.sort(key=lambda e: e["fecha"], reverse=True)
+    return entradas[:max_entradas]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Utilidades de persistencia del estado entre ejecuciones
+"""
+
+import json
+import os
+import logging
+import tempfile
+
+import numpy as np
+
+
+def cargar_json(ruta, defecto=None):
+    """Carga un JSON de estado; si no existe o está corrupto devuelve `defecto`"""
+    if os.path.exists(ruta):
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning(f"Error cargando {ruta}: {e}")
+    return {} if defecto is None else defecto
+
+
+def escribir_atomico(ruta, escribir, binario=True):
+    """Llama a escribir(f) sobre un temporal del mismo directorio y lo renombra
+    a `ruta` (escritura atómica). Los errores se propagan"""
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, tmp = tempfile.mkstemp(dir=directorio, prefix=".tmp_", suffix=os.path.splitext(ruta)[1])
+    try:
+        with (os.fdopen(fd, "wb") if binario else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            escribir(f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, ruta)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def guardar_json(ruta, datos):
+    """Escribe el JSON de forma atómica; un fallo solo se avisa en el log"""
+    try:
+        escribir_atomico(ruta, lambda f: json.dump(datos, f, ensure_ascii=False), binario=False)
+    except Exception as e:
+        logging.warning(f"Error guardando {ruta}: {e}")
+
+
+def guardar_npz(ruta, **arrays):
+    """Como guardar_json, para un .npz de arrays de numpy"""
+    try:
+        escribir_atomico(ruta, lambda f: np.savez(f, **arrays))
+    except Exception as e:
+        logging.warning(f"Error guardando {ruta}: {e}")
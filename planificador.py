@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Planificador adaptativo de consultas a los feeds
+
+Aprende el ritmo de publicación de cada medio a partir de las fechas de sus
+entradas (extraer_fecha_noticia) y decide en cada ejecución qué feeds merece
+la pena consultar y cuántas noticias pedir a cada uno.
+"""
+
+import time
+import logging
+
+from config import PLANIFICADOR_FILE, ESPERA_MAXIMA_FEED, NUEVOS_MINIMOS_CONSULTA
+from feeds import catalogo_feeds, CATALOGO_POR_DEFECTO
+from persistencia import cargar_json, guardar_json
+
+ALFA_TASA = 0.3  # peso de la última observación en la media móvil de la tasa
+
+
+def metadatos_feed(medio):
+    return {**CATALOGO_POR_DEFECTO, **catalogo_feeds.get(medio, {})}
+
+
+class Planificador:
+    def __init__(self, ruta=PLANIFICADOR_FILE, ahora=None):
+        self.ruta = ruta
+        self.ahora = ahora or time.time()
+        self.historial = cargar_json(ruta)
+
+    def tasa(self, medio):
+        """Noticias por hora: la aprendida o, si no hay historial, la del catálogo"""
+        h = self.historial.get(medio, {})
+        if "tasa" in h:
+            return h["tasa"] * 3600
+        return 1 / metadatos_feed(medio)["cadencia"]
+
+    def debe_consultar(self, medio):
+        h = self.historial.get(medio)
+        if not h or "ultima_consulta" not in h:
+            return True
+        horas = (self.ahora - h["ultima_consulta"]) / 3600
+        if horas >= ESPERA_MAXIMA_FEED:
+            return True
+        return self.tasa(medio) * horas >= NUEVOS_MINIMOS_CONSULTA
+
+    def seleccionar(self, feeds_dict):
+        """Divide los medios entre los que se consultan y los que se saltan"""
+        consultar, saltar = {}, []
+        for medio, url in feeds_dict.items():
+            if self.debe_consultar(medio):
+                consultar[medio] = url
+            else:
+                saltar.append(medio)
+        if saltar:
+            logging.info(f"⏭️ {len(saltar)} feeds sin novedades previsibles: {', '.join(saltar)}")
+        return consultar, saltar
+
+    def cupos(self, medios, max_por_feed, max_total=None):
+        """Noticias a pedir por medio.
+        
+        Con `max_total` el presupuesto se reparte en proporción a la tasa de
+        publicación y la prioridad de cada medio, entre 1 y su `max_items`.
+        """
+        maximos = {m: metadatos_feed(m)["max_items"] or max_por_feed for m in medios}
+        if not max_total:
+            return maximos
+        
+        pesos = {m: self.tasa(m) * metadatos_feed(m)["prioridad"] for m in medios}
+        cupos = {}
+        restantes = set(medios)
+        presupuesto = max_total
+        # Los medios que llegan a su máximo liberan presupuesto para el resto
+        while restantes:
+            total_pesos = sum(pesos[m] for m in restantes) or 1
+            saturados = [m for m in restantes if presupuesto * pesos[m] / total_pesos >= maximos[m]]
+            if not saturados:
+                break
+            for m in saturados:
+                cupos[m] = maximos[m]
+                presupuesto -= maximos[m]
+                restantes.remove(m)
+        
+        total_pesos = sum(pesos[m] for m in restantes) or 1
+        for m in restantes:
+            cupos[m] = max(1, round(presupuesto * pesos[m] / total_pesos))
+        return cupos
+
+    def registrar(self, medio, entradas):
+        """Actualiza la tasa del medio con las fechas de una consulta correcta"""
+        h = self.historial.setdefault(medio, {})
+        fechas = sorted(e["fecha"] for e in entradas)
+        
+        tasa_obs = None
+        if "ultima_fecha" in h and "ultima_consulta" in h:
+            nuevas = sum(1 for f in fechas if f > h["ultima_fecha"])
+            tasa_obs = nuevas / max(self.ahora - h["ultima_consulta"], 60)
+        elif len(fechas) >= 2 and fechas[-1] - fechas[0] > 60:
+            tasa_obs = (len(fechas) - 1) / (fechas[-1] - fechas[0])
+        
+        if tasa_obs is not None:
+            h["tasa"] = tasa_obs if "tasa" not in h else ALFA_TASA * tasa_obs + (1 - ALFA_TASA) * h["tasa"]
+        h["ultima_consulta"] = self.ahora
+        if fechas:
+            h["ultima_fecha"] = max(h.get("ultima_fecha", 0), fechas[-1])
+
+    def guardar(self):
+        guardar_json(self.ruta, self.historial)
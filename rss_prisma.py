@@ -4,9 +4,7 @@
 PRISMA - Generador principal (VERSIÓN MEJORADA CON MODO VIGILANTE Y ANÁLISIS DE ENFOQUES)
 """
 
-import feedparser
 import re
-import html
 import random
 from datetime import datetime
 from collections import Counter
@@ -17,20 +15,35 @@ import os
 import time
 import logging
 import urllib.request
+import urllib.error
+import gzip
 import socket
-import pickle
 import urllib.parse
+import queue
+import threading
+import multiprocessing
 from difflib import SequenceMatcher
 from typing import List, Dict, Any, Tuple
 from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # ========== IMPORTAR CONFIGURACIÓN Y FEEDS ==========
 from config import *
 from feeds import feeds_espanoles, feeds_internacionales
+from persistencia import cargar_json, guardar_json
+from planificador import Planificador
+from salud_feeds import RegistroSalud
+from normalizacion import parsear_cuerpo, normalizar_entradas, parsear_y_normalizar, canonizar_url
+from vistos import RegistroVistos
+from historias import AlmacenHistorias
+from archivo_feeds import ArchivoFeeds
+from similitud import normalizar, similitudes, seleccionar, Centroides, grafo_umbral, componentes
+from minhash import IndiceMinHash, firma
+from almacen_embeddings import AlmacenEmbeddings
+from modelo_ia import (
+    obtener_modelo, codificar, codificar_en_procesos, similitudes_servicio,
+    embeddings_frases, directorio_embeddings, dimension_embeddings
+)
 
 # ========== CONFIGURAR LOGGING ==========
 logging.basicConfig(
@@ -43,11 +56,19 @@ logging.basicConfig(
 )
 
 # ========== MODELO IA ==========
-modelo = SentenceTransformer("all-MiniLM-L6-v2")
+# El modelo se carga al primer uso (modelo_ia.obtener_modelo). Los embeddings
+# salen normalizados de codificar(): el coseno es el producto escalar (similitud.py)
+def __getattr__(nombre):
+    # Compatibilidad con `from rss_prisma import modelo, referencias_politicas`
+    if nombre == "modelo":
+        return obtener_modelo()
+    if nombre == "referencias_politicas":
+        return obtener_referencias()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 # ========== REFERENCIAS DE SESGO (SOLO PROGRESISTA/CONSERVADOR) ==========
-referencias_politicas = {
-    "progresista": modelo.encode([
+FRASES_REFERENCIA = {
+    "progresista": [
         # --- DERECHOS SOCIALES ---
         "derecho a la vivienda",
         "sanidad pública universal",
@@ -69,9 +90,9 @@ referencias_politicas = {
         "vivienda pública",
         "justicia social",
         "salario mínimo",
-    ]),
+    ],
     
-    "conservador": modelo.encode([
+    "conservador": [
         # --- SEGURIDAD Y ORDEN ---
         "seguridad ciudadana",
         "mano dura",
@@ -96,15 +117,19 @@ referencias_politicas = {
         "autoridad",
         "fuerzas armadas",
         "monarquía",
-    ]),
+    ],
 }
 
-# ========== FUNCIONES DE UTILIDAD ==========
-def limpiar_html(texto):
-    texto = html.unescape(texto)
-    texto = re.sub(r'<.*?>', '', texto)
-    return re.sub(r'\s+', ' ', texto).strip()
+_referencias = None
 
+def obtener_referencias():
+    """Embeddings de FRASES_REFERENCIA, cacheados en disco entre ejecuciones"""
+    global _referencias
+    if _referencias is None:
+        _referencias = embeddings_frases(FRASES_REFERENCIA, REFERENCIAS_FILE)
+    return _referencias
+
+# ========== FUNCIONES DE UTILIDAD ==========
 def limpiar(texto):
     texto = texto.lower()
     texto = re.sub(r'[^\w\s]', '', texto)
@@ -114,19 +139,19 @@ def limpiar(texto):
 def get_embedding_cache_key(texto):
     return hashlib.md5(texto.encode('utf-8')).hexdigest()
 
-def cargar_cache_embeddings():
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'rb') as f:
-                return pickle.load(f)
-        except Exception as e:
-            logging.warning(f"Error cargando caché: {e}")
+def cargar_cache_embeddings(solo_lectura=False):
+    try:
+        migrar_de = CACHE_FILE if BACKEND_EMBEDDINGS == "torch" and not solo_lectura else None
+        return AlmacenEmbeddings(directorio_embeddings(), migrar_de=migrar_de, solo_lectura=solo_lectura)
+    except Exception as e:
+        logging.warning(f"Error cargando caché: {e}")
     return {}
 
 def guardar_cache_embeddings(cache):
+    if not isinstance(cache, AlmacenEmbeddings):
+        return
     try:
-        with open(CACHE_FILE, 'wb') as f:
-            pickle.dump(cache, f)
+        cache.guardar()
     except Exception as e:
         logging.warning(f"Error guardando caché: {e}")
 
@@ -136,216 +161,564 @@ def son_duplicados_texto(texto1, texto2, umbral_texto=0.8):
     ratio = SequenceMatcher(None, texto1.lower(), texto2.lower()).ratio()
     return ratio > umbral_texto
 
-def extraer_fecha_noticia(entry):
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+def cabeceras_condicionales(estado=None):
+    """Cabeceras de la petición, con los validadores guardados del medio"""
+    headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+    if estado:
+        if estado.get("etag"):
+            headers['If-None-Match'] = estado["etag"]
+        if estado.get("modified"):
+            headers['If-Modified-Since'] = estado["modified"]
+    return headers
+
+def descargar_feed(url, estado=None, timeout=TIMEOUT_FEED):
+    """Descarga el feed con GET condicional. Devuelve (status, cuerpo, cabeceras)"""
+    peticion = urllib.request.Request(url, headers=cabeceras_condicionales(estado))
     try:
-        if hasattr(entry, 'published_parsed') and entry.published_parsed:
-            return time.mktime(entry.published_parsed)
-        elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-            return time.mktime(entry.updated_parsed)
-    except:
-        pass
-    return time.time()
+        with urllib.request.urlopen(peticion, timeout=timeout) as respuesta:
+            cuerpo = respuesta.read()
+            cabeceras = {k.lower(): v for k, v in respuesta.headers.items()}
+            status = respuesta.status
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 304, b"", {k.lower(): v for k, v in e.headers.items()}
+        raise
+    
+    if cabeceras.get('content-encoding', '').lower() == 'gzip':
+        cuerpo = gzip.decompress(cuerpo)
+    return status, cuerpo, cabeceras
 
-def obtener_feed_seguro(url, medio, max_intentos=2):
+def procesar_descarga(medio, status, cuerpo, cabeceras, estado, max_entradas=None, aceptar_bozo=True, parsear=None):
+    """Convierte una descarga en entradas compactas y actualiza el estado del medio.
+    
+    `estado` es el diccionario persistido del medio (etag, modified, hash y
+    entradas de la última descarga). Si el servidor responde 304 o devuelve
+    exactamente el mismo cuerpo, se reutilizan las entradas sin parsear.
+    `parsear(medio, cuerpo, cabeceras, max_entradas)` sustituye a
+    parsear_cuerpo (p. ej. ParseoEnProcesos).
+    `max_entradas` debe ser el máximo fijo del medio, no el cupo de la
+    ejecución: lo guardado se reutiliza en ejecuciones con otros cupos.
+    Devuelve None si el feed está mal formado y no se acepta (`aceptar_bozo`).
+    """
+    if status == 304 and "entradas" in estado:
+        logging.debug(f"Feed {medio} sin cambios (304)")
+        return estado["entradas"][:max_entradas]
+    
+    hash_cuerpo = hashlib.sha1(cuerpo).hexdigest()
+    if hash_cuerpo == estado.get("hash") and "entradas" in estado:
+        logging.debug(f"Feed {medio} sin cambios (mismo contenido)")
+        entradas = estado["entradas"][:max_entradas]
+    else:
+        if parsear:
+            entradas, bozo = parsear(medio, cuerpo, cabeceras, max_entradas)
+        else:
+            entradas, bozo = parsear_cuerpo(cuerpo, cabeceras, max_entradas)
+        if bozo and not aceptar_bozo:
+            return None
+        estado["bozo"] = bozo
+    
+    estado.update({
+        "etag": cabeceras.get("etag"),
+        "modified": cabeceras.get("last-modified"),
+        "hash": hash_cuerpo,
+        "entradas": entradas,
+        "max_entradas": max_entradas
+    })
+    return entradas
+
+def obtener_feed_seguro(url, medio, max_intentos=2, estado=None, max_entradas=None, salud=None, archivo=None, parsear=None):
+    """Devuelve las entradas recientes del feed o None si falla.
+    
+    Con `salud` (RegistroSalud) se anotan latencia, bozo y fallos del medio.
+    Con `archivo` (ArchivoFeeds) se graba la respuesta cruda.
+    """
+    if estado is None:
+        estado = {}
+    inicio = time.time()
     for intento in range(max_intentos):
         try:
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-            feed = feedparser.parse(url, request_headers=headers)
-            if not feed.bozo or intento == max_intentos-1:
-                return feed
+            condicional = estado if not (archivo and archivo.necesita_cuerpo(medio)) else None
+            status, cuerpo, cabeceras = descargar_feed(url, condicional)
+            if archivo:
+                archivo.grabar(medio, url, status, cuerpo, cabeceras)
+            entradas = procesar_descarga(
+                medio, status, cuerpo, cabeceras, estado, max_entradas,
+                aceptar_bozo=(intento == max_intentos-1), parsear=parsear
+            )
+            if entradas is not None:
+                if salud:
+                    salud.exito(medio, time.time() - inicio, estado.get("bozo", False))
+                return entradas
             time.sleep(1)
         except Exception as e:
             if intento == max_intentos-1:
                 logging.error(f"Error feed {medio} tras {max_intentos} intentos: {e}")
-            time.sleep(1)
+                if salud:
+                    salud.fallo(medio, time.time() - inicio, e)
+            else:
+                time.sleep(1)
     return None    
 
-def menciona_espana(texto):
-    """Detecta si el texto menciona España (versión multilingüe mejorada)"""
-    if not texto:
-        return False
-    texto_lower = texto.lower()
+# ========== RECOGER NOTICIAS PARALELO ==========
+class ParseoEnProcesos:
+    """Parseo y normalización de los feeds en un ProcessPoolExecutor.
+    
+    feedparser y limpiar_html son Python puro y con hilos no pasan de un
+    núcleo. Los hilos de descarga siguen bajando los feeds y cada uno espera
+    a que un proceso le devuelva las entradas compactas; las noticias ya
+    normalizadas quedan en `normalizadas` para recoger_noticias_paralelo.
+    
+    Todas las instancias comparten un único pool (las descargas española e
+    internacional van a la vez en modo pipeline), creado con spawn como el
+    de modelo_ia.codificar_en_procesos: se arranca desde un hilo de
+    descarga, con otros hilos en marcha y quizá torch ya cargado.
+    """
+    _pool = None
+    _lock = threading.Lock()
+    
+    def __init__(self, filtrar_espana, procesos=None, cupos=None):
+        self.filtrar_espana = filtrar_espana
+        self.cupos = cupos or {}
+        with ParseoEnProcesos._lock:
+            if ParseoEnProcesos._pool is None:
+                ParseoEnProcesos._pool = ProcessPoolExecutor(
+                    max_workers=procesos, mp_context=multiprocessing.get_context("spawn")
+                )
+        self.pool = ParseoEnProcesos._pool
+        self.normalizadas = {}
+    
+    def __call__(self, medio, cuerpo, cabeceras, max_entradas):
+        futuro = self.pool.submit(parsear_y_normalizar, medio, cuerpo, cabeceras, max_entradas,
+                                  self.filtrar_espana, self.cupos.get(medio))
+        entradas, bozo, noticias = futuro.result()
+        self.normalizadas[medio] = noticias
+        return entradas, bozo
+    
+    @classmethod
+    def cerrar(cls):
+        """Apaga el pool compartido (al final de la ejecución)"""
+        with cls._lock:
+            if cls._pool is not None:
+                cls._pool.shutdown()
+                cls._pool = None
+
+class CacheNoticias:
+    """Noticias ya normalizadas (limpiar_html, fecha, filtro de España) por
+    huella del cuerpo del feed. Un feed sin cambios se sirve de aquí sin
+    parsear ni limpiar nada. Solo se conservan las claves usadas en la última
+    ejecución, así el fichero no crece.
+    """
+    def __init__(self, ruta=CACHE_NOTICIAS_FILE):
+        self.ruta = ruta
+        self.datos = cargar_json(ruta)
+        self.usadas = {}
+        self.aciertos = 0
+    
+    @staticmethod
+    def clave(medio, huella, entradas, filtrar_espana):
+        return f"{medio}|{huella}|{len(entradas)}|{int(filtrar_espana)}"
+    
+    def obtener(self, clave):
+        noticias = self.datos.get(clave)
+        if noticias is not None:
+            self.usadas[clave] = noticias
+            self.aciertos += 1
+        return noticias
+    
+    def poner(self, clave, noticias):
+        self.usadas[clave] = noticias
+    
+    def guardar(self):
+        logging.info(f"♻️ {self.aciertos} feeds sin cambios servidos desde la caché de noticias")
+        guardar_json(self.ruta, self.usadas)
+
+def recoger_noticias_paralelo(feeds_dict, max_por_feed, max_total, filtrar_espana=False, estado_feeds=None, motor=None, planificador=None, salud=None, al_recibir=None, archivo=None, cache_noticias=None, procesos=None):
+    """Descarga los feeds y devuelve las noticias más recientes.
     
-    for keyword in KEYWORDS_ESPANA:
-        if keyword.lower() in texto_lower:
-            return True
+    `motor` elige el backend de descarga: "hilos" (ThreadPoolExecutor) o
+    "async" (asyncio + aiohttp, ver descarga_async.py). Por defecto MOTOR_DESCARGA.
     
-    patrones = [
-        r'\bspanish\b', r'\bspain\b', r'\besp(a|á)ñol\b', r'\bespaña\b',
-        r'\bmadrid\b', r'\bbarcelona\b', r'\bcatalonia\b', r'\bbasque\b',
-        r'pedro sánchez', r'\bfeijóo\b', r'\bvox\b', r'\bpsoe\b', r'\bpp\b',
-    ]
+    Con `planificador` solo se consultan los feeds con novedades previsibles
+    (el resto reutiliza sus últimas entradas guardadas) y el cupo de cada
+    medio sale del catálogo. Sin filtro de España, MAX_NOTICIAS_TOTAL se
+    reparte entre los medios que más publican.
     
-    for patron in patrones:
-        if re.search(patron, texto_lower):
-            return True
+    Con `salud` (RegistroSalud) se saltan los feeds con el circuito abierto
+    y se registra el resultado de cada descarga.
     
-    return False
-
-# ========== RECOGER NOTICIAS PARALELO ==========
-def recoger_noticias_paralelo(feeds_dict, max_por_feed, max_total, filtrar_espana=False):
-    noticias = []
+    `al_recibir(noticias)` se llama con las noticias de cada medio en cuanto
+    se procesan, antes de que terminen los feeds más lentos.
     
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_medio = {}
-        for medio, url in feeds_dict.items():
-            future = executor.submit(obtener_feed_seguro, url, medio)
-            future_to_medio[future] = medio
-        for future in as_completed(future_to_medio):
-            medio = future_to_medio[future]
-            feed = future.result()
-            if not feed:
-                continue
-            
+    Con `archivo` (ArchivoFeeds) las respuestas, los cupos y las entradas
+    reutilizadas se graban o, si el archivo está reproduciendo, se leen de
+    él sin tocar la red.
+    
+    Con `cache_noticias` (CacheNoticias) los feeds cuyo cuerpo no ha cambiado
+    reutilizan las noticias ya normalizadas.
+    
+    Con `procesos` (por defecto PARSEO_EN_PROCESOS) el parseo y la limpieza
+    se hacen en un pool de procesos en vez de en los hilos de descarga; el
+    pool es compartido entre llamadas y lo apaga ParseoEnProcesos.cerrar().
+    """
+    noticias = []
+    if estado_feeds is None:
+        estado_feeds = {}
+    motor = motor or MOTOR_DESCARGA
+    
+    reproduciendo = archivo is not None and archivo.reproduciendo
+    grabando = archivo is not None and not reproduciendo
+    pedidos = feeds_dict
+    
+    if salud:
+        feeds_dict = salud.filtrar(feeds_dict)
+    intentos = {medio: salud.intentos(medio) if salud else 2 for medio in feeds_dict}
+    
+    # Cada feed se parsea y guarda hasta su máximo fijo; el cupo de esta
+    # ejecución (que el planificador cambia de una a otra) se aplica al leer
+    if reproduciendo:
+        # Mismos cupos, entradas reutilizadas y omisiones que la ejecución grabada
+        feeds_dict = {medio: url for medio, url in feeds_dict.items() if not archivo.omitido(medio)}
+        maximos, cupos = archivo.cupos(feeds_dict, max_por_feed)
+        todos = feeds_dict
+        saltados = [medio for medio in feeds_dict if archivo.reutilizadas(medio) is not None]
+        feeds_dict = {medio: url for medio, url in feeds_dict.items() if medio not in saltados}
+    elif planificador:
+        maximos = planificador.cupos(feeds_dict, max_por_feed)
+        cupos = planificador.cupos(feeds_dict, max_por_feed, None if filtrar_espana else max_total)
+        todos = feeds_dict
+        feeds_dict, saltados = planificador.seleccionar(feeds_dict)
+    else:
+        maximos = cupos = {medio: max_por_feed for medio in feeds_dict}
+        todos = feeds_dict
+        saltados = []
+    
+    # Entradas guardadas con otro tope (antes se recortaban al cupo): se
+    # descarta el validador para recibir el feed entero, aunque tocara saltarlo
+    for medio in todos:
+        estado = estado_feeds.get(medio)
+        if estado and "entradas" in estado and estado.get("max_entradas") != maximos[medio]:
+            for campo in ("etag", "modified", "hash"):
+                estado.pop(campo, None)
+            if medio in saltados:
+                saltados.remove(medio)
+                feeds_dict = {**feeds_dict, medio: todos[medio]}
+    if grabando:
+        archivo.anotar_cupos(maximos, cupos)
+    
+    procesos = PARSEO_EN_PROCESOS if procesos is None else procesos
+    parseo = ParseoEnProcesos(filtrar_espana, None if procesos is True else procesos, cupos) if procesos else None
+    
+    def agregar(medio, entradas, consultado=True):
+        if entradas is None:
+            return
+        if planificador and consultado:
+            planificador.registrar(medio, entradas)
+        entradas = entradas[:cupos[medio]]
+        huella = estado_feeds.get(medio, {}).get("hash")
+        clave = CacheNoticias.clave(medio, huella, entradas, filtrar_espana) if cache_noticias and huella else None
+        nuevas = cache_noticias.obtener(clave) if clave else None
+        if nuevas is None and parseo:
+            nuevas = parseo.normalizadas.pop(medio, None)
+        if nuevas is None:
             try:
-                entradas = sorted(feed.entries, key=extraer_fecha_noticia, reverse=True)[:max_por_feed]
-                for entry in entradas:
-                    if "title" in entry and "link" in entry:
-                        titulo = limpiar_html(entry.title)
-                        resumen = limpiar_html(entry.summary) if hasattr(entry, "summary") else ""
-                        
-                        if filtrar_espana:
-                            texto_completo = titulo + " " + resumen
-                            if medio in MEDIOS_SOLO_LOCALES and not menciona_espana(texto_completo):
-                                continue
-                            if not menciona_espana(texto_completo):
-                                continue
-                        
-                        noticias.append({
-                            "medio": medio,
-                            "titulo": titulo,
-                            "resumen": resumen,
-                            "link": entry.link.strip(),
-                            "fecha": extraer_fecha_noticia(entry)
-                        })
+                nuevas = normalizar_entradas(medio, entradas, filtrar_espana)
             except Exception as e:
                 logging.error(f"Error procesando entradas de {medio}: {e}")
+                return
+        if clave:
+            cache_noticias.poner(clave, nuevas)
+        noticias.extend(nuevas)
+        if al_recibir and nuevas:
+            al_recibir(nuevas)
+    
+    for medio in saltados:
+        if reproduciendo:
+            entradas = archivo.reutilizadas(medio)
+        else:
+            entradas = estado_feeds.get(medio, {}).get("entradas", [])
+            if grabando:
+                archivo.reutilizar(medio, entradas)
+        agregar(medio, entradas, consultado=False)
+    
+    if reproduciendo:
+        motor = "archivo"
+    
+    if motor == "async":
+        import descarga_async
+        if not descarga_async.disponible():
+            logging.warning("aiohttp no está instalado, usando descarga con hilos")
+            motor = "hilos"
+    
+    if motor == "archivo":
+        for medio in feeds_dict:
+            resultado = archivo.leer(medio)
+            if resultado is None:
+                logging.warning(f"Feed {medio} no está en la ejecución grabada {archivo.ejecucion}")
+                continue
+            agregar(medio, procesar_descarga(medio, *resultado, estado_feeds.setdefault(medio, {}), maximos[medio], parsear=parseo))
+    elif motor == "async":
+        estados = {medio: estado_feeds.setdefault(medio, {}) for medio in feeds_dict}
+        
+        def al_terminar(medio, resultado, latencia, ultimo=True):
+            if isinstance(resultado, Exception):
+                if salud:
+                    salud.fallo(medio, latencia, resultado)
+                return
+            if archivo:
+                archivo.grabar(medio, feeds_dict[medio], *resultado)
+            # Mismo criterio que obtener_feed_seguro: un feed mal formado solo
+            # se acepta en el último intento
+            entradas = procesar_descarga(medio, *resultado, estados[medio], maximos[medio],
+                                         aceptar_bozo=ultimo, parsear=parseo)
+            if entradas is None:
+                return False
+            if salud:
+                salud.exito(medio, latencia, estados[medio].get("bozo", False))
+            agregar(medio, entradas)
+        
+        cabeceras = {
+            medio: cabeceras_condicionales(None if archivo and archivo.necesita_cuerpo(medio) else estado)
+            for medio, estado in estados.items()
+        }
+        descarga_async.descargar_feeds(feeds_dict, cabeceras, al_terminar, intentos)
+    else:
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            future_to_medio = {}
+            for medio, url in feeds_dict.items():
+                estado = estado_feeds.setdefault(medio, {})
+                future = executor.submit(
+                    obtener_feed_seguro, url, medio, max_intentos=intentos[medio],
+                    estado=estado, max_entradas=maximos[medio], salud=salud, archivo=archivo,
+                    parsear=parseo
+                )
+                future_to_medio[future] = medio
+            for future in as_completed(future_to_medio):
+                agregar(future_to_medio[future], future.result())
+    
+    if grabando:
+        archivo.anotar_omitidos(pedidos)
     
     noticias.sort(key=lambda x: x["fecha"], reverse=True)
     return noticias[:max_total]
 
 # ========== CALCULAR EMBEDDINGS CON CACHÉ ==========
-def calcular_embeddings(noticias, embedding_cache):
+def calcular_embeddings(noticias, embedding_cache, procesos=None):
+    """`procesos` fuerza (o con 0 impide) la codificación en varios procesos;
+    por defecto se usa solo si faltan al menos MIN_TEXTOS_EN_PROCESOS"""
+    if not noticias:
+        dim = embedding_cache.meta["dim"] if isinstance(embedding_cache, AlmacenEmbeddings) else None
+        return np.empty((0, dim or dimension_embeddings()), dtype=np.float32)
     titulos = [n["titulo"] for n in noticias]
-    embeddings_list = []
-    titulos_procesar = []
-    indices_procesar = []
-    
-    for i, titulo in enumerate(titulos):
-        key = get_embedding_cache_key(titulo)
-        if key in embedding_cache:
-            embeddings_list.append(np.array(embedding_cache[key]))
-        else:
-            titulos_procesar.append(titulo)
-            indices_procesar.append(i)
-    
-    if titulos_procesar:
-        nuevos = modelo.encode(titulos_procesar, batch_size=32, show_progress_bar=False)
-        
+    keys = [get_embedding_cache_key(t) for t in titulos]
+    indices_procesar = [i for i, key in enumerate(keys) if key not in embedding_cache]
+    
+    if procesos is None:
+        masivo = len(indices_procesar) >= MIN_TEXTOS_EN_PROCESOS and (os.cpu_count() or 1) > 1
+        procesos = CODIFICACION_EN_PROCESOS if masivo else 0
+    
+    if indices_procesar and procesos:
+        def guardar_tanda(textos, emb):
+            for texto, fila in zip(textos, emb):
+                embedding_cache[get_embedding_cache_key(texto)] = fila
+        codificar_en_procesos([titulos[i] for i in indices_procesar], None if procesos is True else procesos, guardar_tanda)
+    elif indices_procesar:
+        nuevos = codificar([titulos[i] for i in indices_procesar])
         for idx, emb in zip(indices_procesar, nuevos):
-            key = get_embedding_cache_key(titulos[idx])
-            embedding_cache[key] = emb.tolist()
-        
-        emb_completos = [None] * len(titulos)
-        j = 0
-        for i in range(len(titulos)):
-            if i in indices_procesar:
-                emb_completos[i] = nuevos[j]
-                j += 1
-            else:
-                key = get_embedding_cache_key(titulos[i])
-                emb_completos[i] = np.array(embedding_cache[key])
-        
-        embeddings = np.array(emb_completos)
-    else:
-        embeddings = np.array(embeddings_list)
+            embedding_cache[keys[idx]] = emb
     
-    return embeddings
+    # Las filas del almacén son vistas: solo se copian al montar la matriz
+    return np.array([embedding_cache[key] for key in keys], dtype=np.float32).reshape(len(keys), -1)
+
+# ========== CODIFICACIÓN EN SEGUNDO PLANO (PIPELINE) ==========
+class CodificadorIncremental:
+    """Codifica en un hilo aparte los títulos que llegan mientras siguen
+    descargándose feeds, en lotes de `batch_size` (o lo que haya tras
+    `espera` segundos sin novedades). Los resultados van a embedding_cache,
+    así calcular_embeddings solo encuentra aciertos al terminar la descarga.
+    """
+    FIN = object()
+    
+    def __init__(self, embedding_cache, batch_size=32, espera=0.2):
+        self.embedding_cache = embedding_cache
+        self.batch_size = batch_size
+        self.espera = espera
+        self.cola = queue.Queue()
+        self.codificados = 0
+        self.hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self.hilo.start()
+    
+    def encolar(self, noticias):
+        for n in noticias:
+            self.cola.put(n["titulo"])
+    
+    def terminar(self):
+        self.cola.put(self.FIN)
+        self.hilo.join()
+        logging.info(f"🧠 {self.codificados} títulos codificados durante la descarga")
+    
+    def _codificar(self, titulos):
+        try:
+            nuevos = codificar(titulos, batch_size=self.batch_size)
+        except Exception as e:
+            logging.warning(f"Error codificando en segundo plano: {e}")
+            return
+        for titulo, emb in zip(titulos, nuevos):
+            self.embedding_cache[get_embedding_cache_key(titulo)] = emb
+        self.codificados += len(titulos)
+    
+    def _trabajar(self):
+        pendientes = []
+        vistos = set()
+        while True:
+            try:
+                titulo = self.cola.get(timeout=self.espera)
+            except queue.Empty:
+                titulo = None
+            
+            if titulo is self.FIN:
+                if pendientes:
+                    self._codificar(pendientes)
+                return
+            if titulo is not None:
+                key = get_embedding_cache_key(titulo)
+                if key not in self.embedding_cache and key not in vistos:
+                    vistos.add(key)
+                    pendientes.append(titulo)
+            
+            if len(pendientes) >= self.batch_size or (titulo is None and pendientes):
+                self._codificar(pendientes)
+                pendientes = []
 
 # ========== DEDUPLICACIÓN ==========
+BLOQUE_DEDUPLICAR = 256
+
 def deduplicar_noticias(noticias, embeddings):
+    """Recorrido voraz: una noticia se queda si su enlace no se ha visto, no se
+    parece (>= UMBRAL_DUPLICADO) a ninguna de las ya aceptadas y su título no
+    duplica el de ninguna de ellas.
+    
+    Se procesa por bloques: un producto de matrices compara el bloque con todo
+    lo aceptado antes y otro el bloque consigo mismo; dentro del bloque solo
+    queda un máximo enmascarado por noticia. Los títulos solo se comparan con
+    SequenceMatcher contra los candidatos del índice MinHash.
+    """
     filtradas = []
-    emb_filtrados = []
     links_vistos = set()
-    
-    for i, emb in enumerate(embeddings):
-        n = noticias[i]
-        if n["link"] in links_vistos:
-            continue
+    indice_titulos = IndiceMinHash()
+    # Filas aceptadas, en una matriz reservada de antemano
+    emb_filtrados = np.empty_like(embeddings)
+    
+    for inicio in range(0, len(embeddings), BLOQUE_DEDUPLICAR):
+        bloque = embeddings[inicio:inicio + BLOQUE_DEDUPLICAR]
+        aceptadas_antes = len(filtradas)
+        if aceptadas_antes:
+            max_previas = similitudes(bloque, emb_filtrados[:aceptadas_antes]).max(axis=1)
+        else:
+            max_previas = np.full(len(bloque), -np.inf, dtype=np.float32)
+        internas = similitudes(bloque, bloque)
+        aceptadas_bloque = np.zeros(len(bloque), dtype=bool)
         
-        if not emb_filtrados:
+        for j, emb in enumerate(bloque):
+            n = noticias[inicio + j]
+            link = canonizar_url(n["link"])
+            if link in links_vistos:
+                continue
+            
+            if filtradas:
+                max_sim = max_previas[j]
+                if aceptadas_bloque[:j].any():
+                    max_sim = max(max_sim, internas[j, :j][aceptadas_bloque[:j]].max())
+                if max_sim >= UMBRAL_DUPLICADO:
+                    continue
+            
+            firma_titulo = firma(n["titulo"])
+            candidatas = indice_titulos.candidatos(n["titulo"], firma_titulo)
+            if any(son_duplicados_texto(n["titulo"], filtradas[k]["titulo"]) for k in candidatas):
+                continue
+            
+            indice_titulos.agregar(len(filtradas), n["titulo"], firma_titulo)
+            emb_filtrados[len(filtradas)] = emb
+            aceptadas_bloque[j] = True
             filtradas.append(n)
-            emb_filtrados.append(emb)
-            links_vistos.add(n["link"])
-            continue
-        
-        sims = cosine_similarity([emb], emb_filtrados)[0]
-        
-        if max(sims) < UMBRAL_DUPLICADO:
-            es_duplicado_texto = any(
-                son_duplicados_texto(n["titulo"], fn["titulo"])
-                for fn in filtradas
-            )
-            if not es_duplicado_texto:
-                filtradas.append(n)
-                emb_filtrados.append(emb)
-                links_vistos.add(n["link"])
+            links_vistos.add(link)
     
-    return filtradas, np.array(emb_filtrados)
+    return filtradas, emb_filtrados[:len(filtradas)]
 
 # ========== CLUSTERING ==========
 def clusterizar(embeddings):
     grupos = []
+    centroides = Centroides(embeddings.shape[1]) if len(embeddings) else None
     
     for i, emb in enumerate(embeddings):
-        mejor_grupo = None
-        mejor_score = 0
-        
-        for g_idx, grupo in enumerate(grupos):
-            centroide = np.mean(embeddings[grupo], axis=0)
-            score = cosine_similarity([emb], [centroide])[0][0]
-            
-            if score > mejor_score:
-                mejor_score = score
-                mejor_grupo = g_idx
+        if grupos:
+            # Coseno con todos los centroides a la vez; argmax se queda con el
+            # primer grupo en caso de empate, como el recorrido secuencial
+            scores = centroides.puntuar(emb)
+            mejor_grupo = int(np.argmax(scores))
+            mejor_score = scores[mejor_grupo]
+        else:
+            mejor_score = 0
         
         if mejor_score > UMBRAL_CLUSTER:
             grupos[mejor_grupo].append(i)
+            centroides.sumar(mejor_grupo, emb)
         else:
             grupos.append([i])
+            centroides.nuevo(emb)
     
     if not grupos or all(len(g) < 2 for g in grupos):
         logging.info("No hay clusters claros, usando agrupación mínima")
-        grupos = []
-        usados = set()
-        
-        for i in range(len(embeddings)):
-            if i in usados:
-                continue
-            grupo = [i]
-            for j in range(i+1, len(embeddings)):
-                if j in usados:
-                    continue
-                sim = cosine_similarity([embeddings[i]], [embeddings[j]])[0][0]
-                if sim > UMBRAL_AGRUPACION_MIN:
-                    grupo.append(j)
-                    usados.add(j)
-            grupos.append(grupo)
-            usados.add(i)
+        grupos = agrupacion_minima(embeddings)
     else:
         grupos = [g for g in grupos if len(g) >= 2]
     
     grupos.sort(key=len, reverse=True)
     return grupos
 
+def agrupacion_minima(embeddings, modo=None):
+    """Grupos por similitud > UMBRAL_AGRUPACION_MIN sobre el grafo de pares.
+    
+    "voraz": cada noticia aún libre abre un grupo con todas las posteriores
+    libres que se le parecen (el comportamiento de siempre).
+    "componentes": componentes conexas del grafo, así que dos noticias
+    acaban juntas si las une una cadena de parecidos.
+    """
+    modo = modo or AGRUPACION_MINIMA
+    indptr, vecinos = grafo_umbral(embeddings, UMBRAL_AGRUPACION_MIN)
+    
+    if modo == "componentes":
+        etiquetas = componentes(indptr, vecinos)
+        orden = np.argsort(etiquetas, kind="stable")
+        cortes = np.flatnonzero(np.diff(etiquetas[orden])) + 1
+        return [g.tolist() for g in np.split(orden, cortes)] if len(orden) else []
+    
+    grupos = []
+    usados = np.zeros(len(embeddings), dtype=bool)
+    for i in range(len(embeddings)):
+        if usados[i]:
+            continue
+        cercanos = vecinos[indptr[i]:indptr[i + 1]]
+        cercanos = cercanos[~usados[cercanos]]
+        grupos.append([i] + cercanos.tolist())
+        usados[cercanos] = True
+        usados[i] = True
+    return grupos
+
 # ========== ANÁLISIS DE SESGO SIMPLIFICADO ==========
-def analizar_sesgo(indices, noticias):
-    textos = [noticias[i]["titulo"] for i in indices]
-    emb = modelo.encode(textos, batch_size=16, show_progress_bar=False)
-    centroide = np.mean(emb, axis=0).reshape(1, -1)
+def analizar_sesgo(indices, noticias, embeddings=None):
+    # Con la matriz del pipeline (alineada con `noticias`) no se recodifica nada
+    if embeddings is not None:
+        emb = embeddings[indices]
+    else:
+        textos = [noticias[i]["titulo"] for i in indices]
+        emb = codificar(textos)
+    centroide = normalizar(np.mean(emb, axis=0))
     
-    prog = cosine_similarity(centroide, referencias_politicas["progresista"]).mean()
-    cons = cosine_similarity(centroide, referencias_politicas["conservador"]).mean()
+    referencias = obtener_referencias()
+    prog = similitudes(centroide, referencias["progresista"]).mean()
+    cons = similitudes(centroide, referencias["conservador"]).mean()
     
     total = prog + cons
     if total > 0:
@@ -439,47 +812,21 @@ def buscar_noticias_semantico(consulta, noticias, embedding_cache, top_n=50):
     if not consulta or not noticias:
         return []
     
-    key_consulta = get_embedding_cache_key(consulta)
-    if key_consulta in embedding_cache:
-        emb_consulta = np.array(embedding_cache[key_consulta])
-    else:
-        emb_consulta = modelo.encode([consulta])[0]
-        embedding_cache[key_consulta] = emb_consulta.tolist()
-    
-    titulos = [n["titulo"] for n in noticias]
-    embeddings_noticias = []
-    indices_validos = []
-    
-    for i, titulo in enumerate(titulos):
-        key = get_embedding_cache_key(titulo)
-        if key in embedding_cache:
-            embeddings_noticias.append(np.array(embedding_cache[key]))
-            indices_validos.append(i)
-        else:
-            emb = modelo.encode([titulo])[0]
-            embedding_cache[key] = emb.tolist()
-            embeddings_noticias.append(emb)
-            indices_validos.append(i)
-    
-    if not embeddings_noticias:
-        return []
-    
-    embeddings_noticias = np.array(embeddings_noticias)
-    similitudes = cosine_similarity([emb_consulta], embeddings_noticias)[0]
-    
-    resultados = []
-    for idx, sim in zip(indices_validos, similitudes):
-        if sim > 0.5:
-            resultados.append({
-                "noticia": noticias[idx],
-                "similitud": sim
-            })
+    # Con el servicio local en marcha la matriz de noticias ya está en memoria
+    sims = similitudes_servicio(consulta, [n["titulo"] for n in noticias])
+    if sims is None:
+        key_consulta = get_embedding_cache_key(consulta)
+        if key_consulta not in embedding_cache:
+            embedding_cache[key_consulta] = codificar([consulta])[0]
+        emb_consulta = np.asarray(embedding_cache[key_consulta], dtype=np.float32)
+        
+        embeddings_noticias = calcular_embeddings(noticias, embedding_cache)
+        sims = similitudes(emb_consulta, embeddings_noticias)
     
-    resultados.sort(key=lambda x: x["similitud"], reverse=True)
-    return [r["noticia"] for r in resultados[:top_n]]
+    return [noticias[idx] for idx in seleccionar(sims, top_n, umbral=0.5)]
 
 # ========== GENERAR INDEX.HTML ==========
-def generar_index_html(noticias, grupos, fecha_legible, fecha_iso, cachebuster, medios_unicos):
+def generar_index_html(noticias, grupos, fecha_legible, fecha_iso, cachebuster, medios_unicos, embeddings=None, historias=None):
     html = f'''<!DOCTYPE html>
 <html lang="es">
 <head>
@@ -627,15 +974,18 @@ def generar_index_html(noticias, grupos, fecha_legible, fecha_iso, cachebuster,
 '''
     
     for i, grupo in enumerate(grupos[:15]):
-        sesgo = analizar_sesgo(grupo, noticias)
+        sesgo = analizar_sesgo(grupo, noticias, embeddings)
         resumen = resumen_prisma(grupo, noticias)
-        titular = titular_prisma(grupo, noticias)
+        # Con historias persistentes (alineadas con `grupos`) el titular es el de la historia
+        historia = historias[i] if historias else None
+        titular = historia["titular"] if historia else titular_prisma(grupo, noticias)
+        atributos_historia = f' id="historia-{historia["id"]}" data-historia="{historia["id"]}"' if historia else ""
         
         medios_grupo = list(set(noticias[i]["medio"] for i in grupo))
         medios_str = ",".join(medios_grupo)
         
         html += f'''
-        <div class="card" data-medios="{medios_str}">
+        <div class="card" data-medios="{medios_str}"{atributos_historia}>
             <h2>{titular}</h2>
             <div class="resumen">
                 {resumen['emoji']} <strong>Resumen IA:</strong>
@@ -1595,19 +1945,75 @@ Sitemap: https://prismanews.github.io/prisma/sitemap.xml
 
 # ========== MAIN ==========
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generador de Prisma")
+    parser.add_argument("--grabar", action="store_true", help="archiva las respuestas de los feeds")
+    parser.add_argument("--reproducir", nargs="?", const="ultima", metavar="ID",
+                        help="usa una ejecución archivada en lugar de la red (por defecto la última)")
+    args = parser.parse_args()
+    
     inicio_total = time.time()
     logging.info("🚀 Iniciando generación de Prisma")
     
-    embedding_cache = cargar_cache_embeddings() if CACHE_EMBEDDINGS else {}
+    archivo = None
+    if args.reproducir:
+        archivo = ArchivoFeeds(reproducir=args.reproducir)
+    elif args.grabar:
+        archivo = ArchivoFeeds()
+    reproduciendo = archivo is not None and archivo.reproduciendo
+    
+    # Al reproducir se parte de un estado vacío, no se toca el persistido ni
+    # el almacén de embeddings y las páginas van al directorio de la reproducción
+    embedding_cache = cargar_cache_embeddings(solo_lectura=reproduciendo) if CACHE_EMBEDDINGS else {}
+    salida = archivo.salida if reproduciendo else ""
+    estado_feeds = {} if reproduciendo else cargar_json(ESTADO_FEEDS_FILE)
+    planificador = Planificador() if PLANIFICACION_ADAPTATIVA and not reproduciendo else None
+    salud = None if reproduciendo else RegistroSalud()
+    cache_noticias = None if reproduciendo else CacheNoticias()
+    vistos = None if reproduciendo else RegistroVistos()
+    almacen_historias = AlmacenHistorias() if HISTORIAS_PERSISTENTES and not reproduciendo else None
+    
+    def recoger_internacionales():
+        logging.info("🌍 Recogiendo noticias internacionales...")
+        return recoger_noticias_paralelo(
+            feeds_internacionales, 
+            MAX_NOTICIAS_FEED_INT, 
+            MAX_NOTICIAS_INTERNACIONAL,
+            filtrar_espana=True,
+            estado_feeds=estado_feeds,
+            planificador=planificador,
+            salud=salud,
+            archivo=archivo,
+            cache_noticias=cache_noticias
+        )
+    
+    # En modo pipeline la descarga internacional corre a la vez que todo lo
+    # español y los títulos se codifican según llegan
+    codificador = None
+    if PIPELINE_PARALELO:
+        ejecutor_int = ThreadPoolExecutor(max_workers=1)
+        futuro_int = ejecutor_int.submit(recoger_internacionales)
+        codificador = CodificadorIncremental(embedding_cache)
     
     logging.info("📰 Recogiendo noticias españolas...")
-    noticias = recoger_noticias_paralelo(feeds_espanoles, MAX_NOTICIAS_FEED_ES, MAX_NOTICIAS_TOTAL, filtrar_espana=False)
+    noticias = recoger_noticias_paralelo(
+        feeds_espanoles, MAX_NOTICIAS_FEED_ES, MAX_NOTICIAS_TOTAL, filtrar_espana=False,
+        estado_feeds=estado_feeds, planificador=planificador, salud=salud,
+        al_recibir=codificador.encolar if codificador else None, archivo=archivo,
+        cache_noticias=cache_noticias
+    )
+    if codificador:
+        codificador.terminar()
     logging.info(f"✅ {len(noticias)} noticias recogidas")
     
     if not noticias:
         logging.error("❌ No hay noticias. Abortando.")
         exit(1)
     
+    if vistos:
+        noticias = vistos.marcar(noticias)
+        logging.info(f"🆕 {sum(n['nuevo'] for n in noticias)} noticias no vistas en ejecuciones anteriores")
+    
     logging.info("🧠 Calculando embeddings...")
     embeddings = calcular_embeddings(noticias, embedding_cache)
     
@@ -1619,7 +2025,15 @@ if __name__ == "__main__":
     logging.info(f"✅ {len(noticias)} noticias tras deduplicar")
     
     logging.info("📊 Clusterizando...")
-    grupos = clusterizar(embeddings)
+    historias = None
+    if almacen_historias is not None:
+        grupos, ids_historias = almacen_historias.agrupar(noticias, embeddings)
+        historias = [
+            {"id": h, "titular": almacen_historias.titular(h, lambda g=g: titular_prisma(g, noticias))}
+            for g, h in zip(grupos, ids_historias)
+        ]
+    if not historias:
+        grupos, historias = clusterizar(embeddings), None
     logging.info(f"✅ {len(grupos)} grupos formados")
     
     logging.info("📝 Generando index.html...")
@@ -1629,54 +2043,67 @@ if __name__ == "__main__":
     cachebuster = int(fecha.timestamp())
     medios_unicos = len(set(n["medio"] for n in noticias))
     
-    html_index = generar_index_html(noticias, grupos, fecha_legible, fecha_iso, cachebuster, medios_unicos)
-    with open("index.html", "w", encoding="utf-8") as f:
+    html_index = generar_index_html(noticias, grupos, fecha_legible, fecha_iso, cachebuster, medios_unicos, embeddings, historias)
+    with open(os.path.join(salida, "index.html"), "w", encoding="utf-8") as f:
         f.write(html_index)
     
     logging.info("👁️ Preparando modo vigilante...")
-    with open("noticias_cache.json", "w", encoding="utf-8") as f:
+    with open(os.path.join(salida, "noticias_cache.json"), "w", encoding="utf-8") as f:
         json.dump([{
             "titulo": n["titulo"],
             "medio": n["medio"],
             "fecha": n["fecha"],
             "link": n["link"],
-            "resumen": n.get("resumen", "")
+            "resumen": n.get("resumen", ""),
+            "nuevo": n.get("nuevo", True)
         } for n in noticias], f, ensure_ascii=False, indent=2)
     logging.info("✅ Caché para modo vigilante guardado")
     
-    logging.info("🌍 Recogiendo noticias internacionales...")
-    noticias_espana = recoger_noticias_paralelo(
-        feeds_internacionales, 
-        MAX_NOTICIAS_FEED_INT, 
-        MAX_NOTICIAS_INTERNACIONAL,
-        filtrar_espana=True
-    )
-    
-    noticias_espana = list({n["link"]: n for n in noticias_espana}.values())
+    if PIPELINE_PARALELO:
+        noticias_espana = futuro_int.result()
+        ejecutor_int.shutdown()
+    else:
+        noticias_espana = recoger_internacionales()
+    ParseoEnProcesos.cerrar()
+    if vistos:
+        noticias_espana = vistos.marcar(noticias_espana)
+    if archivo:
+        archivo.guardar()
+    if not reproduciendo:
+        guardar_json(ESTADO_FEEDS_FILE, estado_feeds)
+        salud.guardar()
+        cache_noticias.guardar()
+        vistos.guardar()
+    if almacen_historias is not None:
+        almacen_historias.guardar()
+    if planificador:
+        planificador.guardar()
+    
+    noticias_espana = list({canonizar_url(n["link"]): n for n in noticias_espana}.values())
     noticias_espana.sort(key=lambda x: x["fecha"], reverse=True)
     noticias_espana = noticias_espana[:MAX_NOTICIAS_INTERNACIONAL]
     logging.info(f"✅ {len(noticias_espana)} noticias sobre España encontradas")
     
     logging.info("📝 Generando espana.html...")
     html_espana = generar_espana_html(noticias_espana, fecha_legible, fecha_iso, cachebuster, medios_unicos)
-    with open("espana.html", "w", encoding="utf-8") as f:
+    with open(os.path.join(salida, "espana.html"), "w", encoding="utf-8") as f:
         f.write(html_espana)
     
     logging.info("📝 Generando sobre.html...")
     html_sobre = generar_sobre_html(fecha_legible, fecha_iso, cachebuster, medios_unicos)
-    with open("sobre.html", "w", encoding="utf-8") as f:
+    with open(os.path.join(salida, "sobre.html"), "w", encoding="utf-8") as f:
         f.write(html_sobre)
     
     logging.info("👁️ Generando página de vigilante (búsqueda vacía)...")
     html_vigilante = generar_vigilante_html("", [], [], fecha_legible, fecha_iso, cachebuster, medios_unicos)
-    with open("vigilante.html", "w", encoding="utf-8") as f:
+    with open(os.path.join(salida, "vigilante.html"), "w", encoding="utf-8") as f:
         f.write(html_vigilante)
     
     logging.info("🗺️ Generando sitemap.xml...")
-    with open("sitemap.xml", "w", encoding="utf-8") as f:
+    with open(os.path.join(salida, "sitemap.xml"), "w", encoding="utf-8") as f:
         f.write(generar_sitemap())
     
-    with open("robots.txt", "w", encoding="utf-8") as f:
+    with open(os.path.join(salida, "robots.txt"), "w", encoding="utf-8") as f:
         f.write(generar_robots())
     
     tiempo_total = time.time() - inicio_total
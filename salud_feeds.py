@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Registro de salud de los feeds con circuit breaker
+
+Guarda entre ejecuciones los fallos consecutivos, la latencia y la tasa de
+feeds mal formados (bozo) de cada medio. Tras FALLOS_APERTURA_CIRCUITO fallos
+seguidos el circuito se abre y el feed no se consulta hasta que pasa la
+espera (backoff exponencial); entonces se sondea con un único intento.
+"""
+
+import time
+import logging
+
+from config import SALUD_FEEDS_FILE, FALLOS_APERTURA_CIRCUITO, BACKOFF_BASE_HORAS, BACKOFF_MAX_HORAS
+from persistencia import cargar_json, guardar_json
+
+ALFA = 0.3  # peso de la última medida en las medias móviles
+
+
+class RegistroSalud:
+    def __init__(self, ruta=SALUD_FEEDS_FILE, ahora=None):
+        self.ruta = ruta
+        self.ahora = ahora or time.time()
+        self.registro = cargar_json(ruta)
+
+    def _media(self, h, campo, valor):
+        h[campo] = valor if campo not in h else ALFA * valor + (1 - ALFA) * h[campo]
+
+    def disponible(self, medio):
+        """False mientras el circuito del medio está abierto"""
+        return self.registro.get(medio, {}).get("abierto_hasta", 0) <= self.ahora
+
+    def intentos(self, medio, max_intentos=2):
+        """Un feed que viene fallando se sondea con un solo intento y sin esperas"""
+        if self.registro.get(medio, {}).get("fallos", 0):
+            return 1
+        return max_intentos
+
+    def filtrar(self, feeds_dict):
+        disponibles = {m: url for m, url in feeds_dict.items() if self.disponible(m)}
+        abiertos = [m for m in feeds_dict if m not in disponibles]
+        if abiertos:
+            logging.info(f"🔌 {len(abiertos)} feeds con el circuito abierto: {', '.join(abiertos)}")
+        return disponibles
+
+    def exito(self, medio, latencia, bozo=False):
+        h = self.registro.setdefault(medio, {})
+        if h.get("fallos", 0) >= FALLOS_APERTURA_CIRCUITO:
+            logging.info(f"🔌 Feed {medio} recuperado tras {h['fallos']} fallos")
+        h["fallos"] = 0
+        h.pop("abierto_hasta", None)
+        h["ultimo_exito"] = self.ahora
+        self._media(h, "latencia", latencia)
+        self._media(h, "bozo", 1.0 if bozo else 0.0)
+
+    def fallo(self, medio, latencia, error=None):
+        h = self.registro.setdefault(medio, {})
+        h["fallos"] = h.get("fallos", 0) + 1
+        self._media(h, "latencia", latencia)
+        if error:
+            h["ultimo_error"] = str(error)[:200]
+        
+        exceso = h["fallos"] - FALLOS_APERTURA_CIRCUITO
+        if exceso >= 0:
+            espera = min(BACKOFF_BASE_HORAS * 2 ** exceso, BACKOFF_MAX_HORAS)
+            h["abierto_hasta"] = self.ahora + espera * 3600
+            logging.warning(f"🔌 Circuito abierto para {medio} ({h['fallos']} fallos seguidos), próximo sondeo en {espera}h")
+
+    def guardar(self):
+        guardar_json(self.ruta, self.registro)
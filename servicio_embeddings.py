@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Servicio local de embeddings
+Ejecutar: python servicio_embeddings.py
+
+Proceso de larga duración que mantiene cargados el modelo y la matriz de
+embeddings de noticias_cache.json (se recarga sola cuando el fichero
+cambia), escuchando en 127.0.0.1:PUERTO_SERVICIO_EMBEDDINGS:
+
+    POST /codificar    {"textos": [...]}              -> float32 (filas x dim)
+    POST /similitudes  {"consulta": "...", "huella"}  -> float32 (una por noticia)
+    GET  /estado
+
+Las peticiones que llegan a la vez se juntan en un solo encode (micro-lotes
+de hasta MAX_LOTE textos o ESPERA_LOTE segundos). buscar.py y
+buscar_vigilante.py lo usan a través de modelo_ia.codificar(); si no está
+en marcha codifican en su propio proceso como siempre.
+"""
+
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+import http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from similitud import similitudes
+from modelo_ia import obtener_modelo, codificar_en_lotes
+from config import (
+    PUERTO_SERVICIO_EMBEDDINGS, TIMEOUT_SERVICIO_EMBEDDINGS,
+    MODELO_EMBEDDINGS, BACKEND_EMBEDDINGS
+)
+
+NOTICIAS_FILE = "noticias_cache.json"
+MAX_LOTE = 64
+ESPERA_LOTE = 0.005
+IDENTIDAD = f"{MODELO_EMBEDDINGS}|{BACKEND_EMBEDDINGS}"
+
+
+def huella_titulos(titulos):
+    """Identifica una lista de titulares (la matriz del servicio debe coincidir)"""
+    return hashlib.md5("\n".join(titulos).encode("utf-8")).hexdigest()
+
+
+# ========== CLIENTE ==========
+def _pedir(ruta, datos):
+    """Cuerpo de la respuesta como matriz float32, o None si el servicio no
+    está, no responde o usa otro modelo/backend"""
+    try:
+        conexion = http.client.HTTPConnection("127.0.0.1", PUERTO_SERVICIO_EMBEDDINGS, timeout=TIMEOUT_SERVICIO_EMBEDDINGS)
+        conexion.request("POST", ruta, json.dumps(datos), {"Content-Type": "application/json"})
+        respuesta = conexion.getresponse()
+        cuerpo = respuesta.read()
+        conexion.close()
+    except (OSError, http.client.HTTPException):
+        return None
+    if respuesta.status != 200 or respuesta.getheader("X-Modelo") != IDENTIDAD:
+        return None
+    filas = int(respuesta.getheader("X-Filas"))
+    return np.frombuffer(cuerpo, dtype=np.float32).reshape(filas, -1)
+
+
+def codificar_remoto(textos):
+    return _pedir("/codificar", {"textos": list(textos)})
+
+
+def similitudes_remotas(consulta, titulos):
+    resultado = _pedir("/similitudes", {"consulta": consulta, "huella": huella_titulos(titulos)})
+    return None if resultado is None else resultado[:, 0]
+
+
+# ========== SERVIDOR ==========
+class ServicioEmbeddings:
+    def __init__(self):
+        self.modelo = obtener_modelo()
+        self.cola = queue.Queue()
+        self.lock_noticias = threading.Lock()
+        self.mtime_noticias = None
+        self.huella_noticias = None
+        self.matriz_noticias = None
+        threading.Thread(target=self._lotes, daemon=True).start()
+
+    def codificar(self, textos):
+        """Llamado desde los hilos del servidor; espera a que salga su lote"""
+        pedido = {"textos": textos, "listo": threading.Event()}
+        self.cola.put(pedido)
+        pedido["listo"].wait()
+        if "error" in pedido:
+            raise pedido["error"]
+        return pedido["emb"]
+
+    def _lotes(self):
+        while True:
+            pedidos = [self.cola.get()]
+            total = len(pedidos[0]["textos"])
+            limite = time.monotonic() + ESPERA_LOTE
+            while total < MAX_LOTE:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self.cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                pedidos.append(pedido)
+                total += len(pedido["textos"])
+
+            textos = [t for p in pedidos for t in p["textos"]]
+            try:
+                emb = codificar_en_lotes(self.modelo, textos)
+            except Exception as e:
+                emb = None
+                logging.error(f"Error codificando lote de {len(textos)}: {e}")
+            inicio = 0
+            for pedido in pedidos:
+                if emb is None:
+                    pedido["error"] = RuntimeError("fallo al codificar")
+                else:
+                    pedido["emb"] = emb[inicio:inicio + len(pedido["textos"])]
+                inicio += len(pedido["textos"])
+                pedido["listo"].set()
+            if len(pedidos) > 1:
+                logging.info(f"🧠 Lote de {len(textos)} textos ({len(pedidos)} peticiones)")
+
+    def noticias(self):
+        """(huella, matriz de embeddings) de noticias_cache.json, recargada si cambia"""
+        mtime = os.path.getmtime(NOTICIAS_FILE)
+        with self.lock_noticias:
+            if mtime != self.mtime_noticias:
+                from almacen_embeddings import AlmacenEmbeddings
+                from modelo_ia import directorio_embeddings
+                from rss_prisma import calcular_embeddings
+                with open(NOTICIAS_FILE, "r", encoding="utf-8") as f:
+                    noticias = json.load(f)
+                # El almacén lo escribe rss_prisma.py: aquí solo se lee
+                almacen = AlmacenEmbeddings(directorio_embeddings(), solo_lectura=True)
+                self.matriz_noticias = calcular_embeddings(noticias, almacen)
+                self.huella_noticias = huella_titulos([n["titulo"] for n in noticias])
+                self.mtime_noticias = mtime
+                logging.info(f"📰 Matriz de {len(noticias)} noticias cargada")
+            return self.huella_noticias, self.matriz_noticias
+
+    def similitudes(self, consulta, huella):
+        huella_actual, matriz = self.noticias()
+        if huella != huella_actual:
+            return None
+        return similitudes(self.codificar([consulta])[0], matriz).reshape(-1, 1)
+
+
+class Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # el valor por defecto (5) rechaza ráfagas de clientes
+
+
+class Manejador(BaseHTTPRequestHandler):
+    servicio = None
+
+    def _responder(self, status, cuerpo, cabeceras=None):
+        self.send_response(status)
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _matriz(self, matriz):
+        matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+        self._responder(200, matriz.tobytes(), {
+            "Content-Type": "application/octet-stream",
+            "X-Filas": str(len(matriz)),
+            "X-Modelo": IDENTIDAD,
+        })
+
+    def do_GET(self):
+        if self.path != "/estado":
+            return self._responder(404, b"")
+        estado = {"modelo": IDENTIDAD, "noticias": self.servicio.huella_noticias}
+        self._responder(200, json.dumps(estado).encode("utf-8"), {"Content-Type": "application/json"})
+
+    def do_POST(self):
+        try:
+            datos = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path == "/codificar":
+                return self._matriz(self.servicio.codificar(datos["textos"]))
+            if self.path == "/similitudes":
+                similitudes = self.servicio.similitudes(datos["consulta"], datos["huella"])
+                if similitudes is None:
+                    return self._responder(409, b"noticias distintas")
+                return self._matriz(similitudes)
+            self._responder(404, b"")
+        except Exception as e:
+            logging.error(f"Error en {self.path}: {e}")
+            self._responder(500, str(e).encode("utf-8"))
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    Manejador.servicio = ServicioEmbeddings()
+    if os.path.exists(NOTICIAS_FILE):
+        Manejador.servicio.noticias()
+    servidor = Servidor(("127.0.0.1", PUERTO_SERVICIO_EMBEDDINGS), Manejador)
+    logging.info(f"🟢 Servicio de embeddings en 127.0.0.1:{PUERTO_SERVICIO_EMBEDDINGS} ({IDENTIDAD})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Núcleo de similitud entre embeddings
+
+Los embeddings se normalizan (norma L2 = 1) una sola vez, al codificarlos
+(modelo_ia.codificar), así que el coseno entre dos de ellos es su producto
+escalar y las comparaciones de cada etapa son productos de matrices de
+BLAS en lugar de llamadas sueltas a sklearn. Los centroides, que no salen
+del codificador, se normalizan al actualizarlos (Centroides).
+"""
+
+import numpy as np
+
+BLOQUE = 4096  # filas por bloque en las operaciones sobre matrices grandes
+
+
+def normalizar(matriz):
+    """Filas de norma 1 (las nulas se dejan a cero)"""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    return matriz / np.maximum(normas, 1e-12)
+
+
+def similitudes(a, b):
+    """Coseno entre vectores ya normalizados: a (d,) o (n, d) contra b (m, d)"""
+    return np.asarray(a, dtype=np.float32) @ np.asarray(b, dtype=np.float32).T
+
+
+def seleccionar(sims, k=None, umbral=None):
+    """Índices de `sims` ordenados de mayor a menor (a igualdad, el primero),
+    solo los que superan `umbral` y como mucho `k`"""
+    sims = np.asarray(sims)
+    candidatos = np.arange(len(sims)) if umbral is None else np.flatnonzero(sims > umbral)
+    if k is not None and len(candidatos) > k:
+        # Preselección O(n): el k-ésimo valor marca el corte, empates incluidos
+        corte = np.partition(sims[candidatos], len(candidatos) - k)[len(candidatos) - k]
+        candidatos = candidatos[sims[candidatos] >= corte]
+    orden = np.lexsort((candidatos, -sims[candidatos]))
+    return candidatos[orden][:k]
+
+
+def grafo_umbral(matriz, umbral, max_elementos=BLOQUE * BLOQUE):
+    """Vecinos j > i de cada fila i con similitud > umbral, como (indptr,
+    indices) en formato CSR: los de i son indices[indptr[i]:indptr[i + 1]],
+    en orden creciente. Las similitudes se calculan por bloques de filas de
+    como mucho `max_elementos` valores"""
+    n = len(matriz)
+    filas_bloque = max(1, max_elementos // max(n, 1))
+    cuentas = np.zeros(n, dtype=np.int64)
+    partes = []
+    for inicio in range(0, n, filas_bloque):
+        # Solo las columnas desde `inicio`: el triángulo inferior no hace falta
+        sims = similitudes(matriz[inicio:inicio + filas_bloque], matriz[inicio:])
+        filas, columnas = np.nonzero(np.triu(sims > umbral, k=1))
+        cuentas[inicio:inicio + len(sims)] = np.bincount(filas, minlength=len(sims))
+        partes.append(columnas + inicio)
+    indptr = np.concatenate([[0], np.cumsum(cuentas)])
+    indices = np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)
+    return indptr, indices
+
+
+def componentes(indptr, indices):
+    """Etiqueta de componente conexa de cada nodo del grafo CSR: el menor
+    índice de su componente. Enganche de raíces y salto de punteros con
+    operaciones de numpy, O(log n) pasadas sobre las aristas"""
+    n = len(indptr) - 1
+    origen = np.repeat(np.arange(n), np.diff(indptr))
+    etiqueta = np.arange(n)
+    while True:
+        a, b = etiqueta[origen], etiqueta[indices]
+        menor = np.minimum(a, b)
+        nueva = etiqueta.copy()
+        np.minimum.at(nueva, a, menor)
+        np.minimum.at(nueva, b, menor)
+        while True:
+            saltada = nueva[nueva]
+            if np.array_equal(saltada, nueva):
+                break
+            nueva = saltada
+        if np.array_equal(nueva, etiqueta):
+            return etiqueta
+        etiqueta = nueva
+
+
+class Centroides:
+    """Centroides de grupos que crecen de uno en uno.
+    
+    Cada grupo guarda la suma de sus vectores (float64, sin recalcular la
+    media de sus miembros) y su centroide normalizado en una matriz
+    reservada de antemano, que se duplica al llenarse; puntuar() compara un
+    vector con todos los centroides en un solo producto matriz-vector.
+    """
+    def __init__(self, dim, capacidad=64):
+        self.sumas = np.zeros((capacidad, dim), dtype=np.float64)
+        self.matriz = np.zeros((capacidad, dim), dtype=np.float32)
+        self.tamanos = np.zeros(capacidad, dtype=np.int64)
+        self.n = 0
+    
+    def __len__(self):
+        return self.n
+    
+    def _crecer(self):
+        for nombre in ("sumas", "matriz", "tamanos"):
+            actual = getattr(self, nombre)
+            nuevo = np.zeros((2 * len(actual),) + actual.shape[1:], dtype=actual.dtype)
+            nuevo[:self.n] = actual[:self.n]
+            setattr(self, nombre, nuevo)
+    
+    def puntuar(self, vector):
+        """Coseno del vector (normalizado) con cada centroide"""
+        return similitudes(vector, self.matriz[:self.n])
+    
+    def nuevo(self, vector, tamano=1):
+        """Abre un grupo con `vector` como suma; devuelve su índice"""
+        if self.n == len(self.matriz):
+            self._crecer()
+        k = self.n
+        self.n += 1
+        self.sumas[k] = 0
+        self.tamanos[k] = 0
+        self.sumar(k, vector, tamano)
+        return k
+    
+    def sumar(self, k, vector, tamano=1):
+        """Añade al grupo k un vector (o una suma de `tamano` vectores)"""
+        self.sumas[k] += vector
+        self.tamanos[k] += tamano
+        # El centroide normalizado es la suma normalizada: no hace falta dividir
+        self.matriz[k] = self.sumas[k] / max(np.linalg.norm(self.sumas[k]), 1e-12)
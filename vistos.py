@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+PRISMA - Registro de artículos ya vistos en ejecuciones anteriores
+
+Cada artículo se identifica por un hash de 64 bits de su URL canónica
+(normalizacion.canonizar_url). El registro guarda VISTOS_GENERACIONES
+generaciones de VISTOS_HORAS_GENERACION horas cada una como arrays
+ordenados de uint64 (8 bytes por artículo, búsqueda con searchsorted);
+al empezar una generación nueva se descarta la más antigua, así que un
+artículo se olvida tras GENERACIONES x HORAS sin aparecer.
+"""
+
+import os
+import time
+import hashlib
+import logging
+
+import numpy as np
+
+from config import VISTOS_FILE, VISTOS_HORAS_GENERACION, VISTOS_GENERACIONES
+from normalizacion import canonizar_url
+from persistencia import guardar_npz
+
+
+def hash_url(url):
+    """Hash de 64 bits de la URL canónica"""
+    digest = hashlib.blake2b(canonizar_url(url).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class RegistroVistos:
+    def __init__(self, ruta=VISTOS_FILE, ahora=None):
+        self.ruta = ruta
+        self.ahora = ahora or time.time()
+        self.generaciones = []  # [(inicio, array ordenado)], la actual primero
+        self.nuevos = set()
+        if os.path.exists(ruta):
+            try:
+                with np.load(ruta) as datos:
+                    inicios = datos["inicios"]
+                    self.generaciones = [(float(inicios[i]), datos[f"gen_{i}"]) for i in range(len(inicios))]
+            except Exception as e:
+                logging.warning(f"Error cargando {ruta}: {e}")
+        ventana = VISTOS_GENERACIONES * VISTOS_HORAS_GENERACION * 3600
+        self.generaciones = [(i, c) for i, c in self.generaciones if self.ahora - i < ventana]
+        if not self.generaciones or self.ahora - self.generaciones[0][0] >= VISTOS_HORAS_GENERACION * 3600:
+            self.generaciones.insert(0, (self.ahora, np.empty(0, dtype=np.uint64)))
+        del self.generaciones[VISTOS_GENERACIONES:]
+
+    def contiene(self, hashes):
+        """Máscara de los hashes que ya estaban registrados al cargar"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        vistos = np.zeros(len(hashes), dtype=bool)
+        for _, claves in self.generaciones:
+            if len(claves):
+                pos = np.minimum(np.searchsorted(claves, hashes), len(claves) - 1)
+                vistos |= claves[pos] == hashes
+        return vistos
+
+    def marcar(self, noticias):
+        """Copias de las noticias con "nuevo" (False si su URL canónica ya se
+        vio en otra ejecución), registradas en la generación actual. Se copian
+        porque las originales pueden venir de CacheNoticias"""
+        hashes = [hash_url(n["link"]) for n in noticias]
+        vistos = self.contiene(hashes)
+        self.nuevos.update(hashes)
+        return [dict(n, nuevo=not visto) for n, visto in zip(noticias, vistos)]
+
+    def guardar(self):
+        inicio, actual = self.generaciones[0]
+        if self.nuevos:
+            actual = np.union1d(actual, np.fromiter(self.nuevos, dtype=np.uint64, count=len(self.nuevos)))
+            self.generaciones[0] = (inicio, actual)
+            self.nuevos = set()
+        arrays = {f"gen_{i}": claves for i, (_, claves) in enumerate(self.generaciones)}
+        guardar_npz(self.ruta, inicios=np.array([i for i, _ in self.generaciones]), **arrays)